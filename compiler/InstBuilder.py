@@ -3,21 +3,29 @@ from contextlib import contextmanager, nullcontext
 from compiler.Visitor import Visitor
 from compiler.exceptions import MipsCodeError, MipsUnboundLocalError, MipsAttributeError, MipsNameError, \
     MipsAttributeCantSetError, MipsTypeErrorMissingArguments, MipsTypeErrorToManyArguments
-from compiler.look_ahead_can_assign import LACanAssign
-from compiler.look_ahead_can_branch import LACanBranch
+from compiler.instruction import format_immediate, compare_branch, BRANCH_OPCODES, INVERSE_BRANCHES
 from compiler.look_ahead_expr_rearrange import LAExprRearrange
-from compiler.look_ahead_is_const import LAIsConst
-from compiler.look_ahead_return_type import LAReturnType
+from compiler.semantic_annotation import SemanticAnnotator
 from compiler.types import Device, Function, Variable, VarType, FunctionBuiltIn
 
 from lark import Tree
 from lark.lexer import Token
 
+# Expressions SemanticAnnotator may evaluate at compile time
+FOLDABLE = {'expr', 'term', 'arith_expr', 'comparison', 'and_test', 'or_test', 'not_test', 'test', 'factor', 'call',
+            'subscript', 'subscriptlist'}
+
 
 class InstBuilder(Visitor):
 
-    def __init__(self):
+    def __init__(self, rotate_loops=False):
+        """
+        :param rotate_loops: emit while loops as a guarded do-while with the test at the bottom
+        """
+        self.rotate_loops = rotate_loops
         self._free_register_counter = 0
+        # Temporaries are virtual registers t<depth>.<scope>, a new scope starts with every statement
+        self._temp_scope = 0
         self.idtable = {'out': 'o'}
         self.device_table = {'db': Device('db', 'Socket')}
         self.vtable = {'label': Function(self._label, Device()),
@@ -46,6 +54,10 @@ class InstBuilder(Visitor):
         self.labels = {}
         self.label = 0
         self.program = []
+        # (instruction index, operand slot, label) for every label operand in program
+        self.fixups = []
+        self.annotator = SemanticAnnotator(self)
+        self.rearrange = LAExprRearrange(self)
 
     @contextmanager
     def free_register(self, can_direct_access=None, eval_as_const=None, store_dst=None):
@@ -63,16 +75,37 @@ class InstBuilder(Visitor):
             return
         free = self._free_register_counter
         self._free_register_counter += 1
-        if free < 0 or free > 15:
-            raise MipsCodeError(f'Invalid register r{free}')
-        yield f'r{free}'
+        yield self._temp_register(free)
         self._free_register_counter -= 1
 
+    def visit(self, node, **kwargs):
+        if node.data in FOLDABLE:
+            value = self.annotator.facts(node).value
+            if value is not None:
+                # Evaluated by SemanticAnnotator, no code needed
+                return format_immediate(value)
+        return super().visit(node, **kwargs)
+
+    @contextmanager
+    def operand_register(self, store_dst=None):
+        """
+        A temporary for an operand that differs from the result register, store_dst or the one
+        cur_stack_dst returns, so the operand value stays available to value numbering
+        """
+        with self.free_register(store_dst=store_dst):
+            with self.free_register() as s0:
+                yield s0
+
+    def _temp_register(self, depth):
+        return f't{depth}.{self._temp_scope}'
+
     @property
     def cur_register(self):
-        if self._free_register_counter < 0 or self._free_register_counter > 15:
-            raise MipsCodeError(f'Invalid register r{self._free_register_counter}')
-        return f'r{self._free_register_counter}'
+        return self._temp_register(self._free_register_counter)
+
+    def _visit_stmt(self, stmt):
+        self._temp_scope += 1
+        self.visit(stmt)
 
     def cur_stack_dst(self, store_dst=None):
         if store_dst:
@@ -92,24 +125,61 @@ class InstBuilder(Visitor):
             label = f'L{self.label}'
         return label
 
-    def _add_instruction(self, inst, desc):
-        self.program.append((inst, desc))
+    def _add_instruction(self, inst):
+        """
+        :param inst: tuple of opcode and operands, see compiler.instruction.describe for the description
+        """
+        self.program.append(inst)
+
+    def _add_branch_instruction(self, inst, label):
+        """
+        Add an instruction whose last operand is label, the operand is patched by Compiler.resolve_labels
+        """
+        self.fixups.append((len(self.program), len(inst), label))
+        self._add_instruction(inst + (label,))
 
     def _push_copy_inst(self, src, dst):
-        self._add_instruction(f'move {dst} {src}', f'{src} -> {dst}')
+        self._add_instruction(('move', dst, src))
 
-    def _push_conditional_jump_inst(self, condition, label, eq=False):
-        if label is None:
-            self.label += 1
-            label = f'L{self.label}'
-        self.labels[label] = None
-        label_str = '{' + str(label) + '}'
+    def _branch_if_false(self, test):
+        """
+        Evaluate test and jump to the returned label when it is false.
+        Comparisons become one fused compare and branch instruction.
+        """
+        label = self._create_label()
+        self._branch_on(test, label, when=False)
+        return label
 
-        op = 'beq' if eq else 'bne'
+    def _branch_on(self, test, label, when):
+        """
+        Jump to label when the truth value of test is when.
+        and/or become short-circuit jump chains that skip the remaining operands once the result is known.
+        """
+        test_facts = self.annotator.facts(test)
+        if test_facts.value is None and test.data in ('and_test', 'or_test'):
+            # The operand value that decides the result, false for and, true for or
+            decisive = test.data == 'or_test'
+            operands = test.children
+            if when == decisive:
+                for operand in operands:
+                    self._branch_on(operand, label, when)
+            else:
+                skip = self._create_label()
+                for operand in operands[:-1]:
+                    self._branch_on(operand, skip, decisive)
+                self._branch_on(operands[-1], label, when)
+                self._insert_label(skip)
+            return
+        if test_facts.value is None and test.data == 'not_test':
+            self._branch_on(test.children[0], label, not when)
+            return
 
-        self._add_instruction(f'{op} {condition} 0 {label_str}',
-                              f'Jump to {label_str} if {"not " if eq else ""}{condition}')
-        return label
+        with self.free_register(can_direct_access=test_facts.can_assign) as t0:
+            if test_facts.can_branch:
+                self.visit(test, store_dst=t0, branch_dst=label, branch_when=when)
+                return
+            t0 = self.visit(test, store_dst=t0)
+        self._add_branch_instruction(compare_branch('bne' if when else 'beq', t0, '0'), label)
 
     def _push_jump_inst(self, label=None):
         if label is None:
@@ -117,13 +187,14 @@ class InstBuilder(Visitor):
             label = f'L{self.label}'
         if label not in self.labels:
             self.labels[label] = None
-        label_str = '{' + str(label) + '}'
-        self._add_instruction(f'j {label_str}', f'Jump to {label_str}')
+        self._add_branch_instruction(('j',), label)
         return label
 
     def root(self, stmts):
+        # Annotate the whole tree before generating any code
+        self.annotator.annotate(stmts)
         for stmt in stmts.children:
-            self.visit(stmt)
+            self._visit_stmt(stmt)
 
     def var(self, var, assignment=False, **kwargs):
         name: str = var.children[0].value
@@ -133,8 +204,8 @@ class InstBuilder(Visitor):
         elif name in self.device_table:
             return self.device_table[name]
         elif assignment:
-            self.idtable[name] = self.cur_register
-            self._free_register_counter += 1
+            # Variables get their own virtual register, the RegisterAllocator maps it to r0-r15
+            self.idtable[name] = f'v{len(self.idtable)}'
             return self.idtable[name]
         else:
             raise MipsUnboundLocalError(name)
@@ -148,9 +219,16 @@ class InstBuilder(Visitor):
     def loc(self, loc, **kwargs):
         return loc.children[0].value
 
-    def factor(self, number, **kwargs):
+    def factor(self, number, store_dst=None, **kwargs):
         if number.children[0].value == '-':
-            return f'-{self.visit(number.children[1])}'
+            operand = number.children[1]
+            if operand.data == 'number':
+                return f'-{self.visit(operand)}'
+            with self.operand_register(store_dst=store_dst) as s0:
+                r0 = self.visit(operand, store_dst=s0)
+            dst = self.cur_stack_dst(store_dst)
+            self._add_instruction(('sub', dst, '0', r0))
+            return dst
         raise Exception(f'Unknown factor "{number.children[0].value}"')
 
     def number(self, number, **kwargs):
@@ -164,10 +242,14 @@ class InstBuilder(Visitor):
         else:
             prop = args[1].children[0].value
 
-        self._add_instruction(f'alias {prop} {device}', f'alias {prop} {device}')
+        self._add_instruction(('alias', prop, device))
         return Device(device, prop)
 
     def if_stmt(self, stmt):
+        select = self._as_select(stmt)
+        if select is not None:
+            self.visit(select)
+            return
         exit_jump = self._create_label()
         self._recursive_if_stmt(stmt.children.copy(), exit_jump)
         self._insert_label(exit_jump)
@@ -198,9 +280,64 @@ class InstBuilder(Visitor):
                 lst = lst[1:]
             return t0
 
+    def _is_simple(self, node):
+        """An operand select can take without running code, an immediate or a variable"""
+        if self.annotator.facts(node).is_const:
+            return True
+        return node.data == 'var' and node.children[0].value in self.idtable
+
+    def _can_select(self, test, if_value, else_value):
+        """
+        select pays off for immediate or variable operands. and/or/not conditions keep their
+        short-circuit branches, they would need every operand evaluated.
+        """
+        if test.data in ('and_test', 'or_test', 'not_test'):
+            return False
+        return self._is_simple(if_value) and self._is_simple(else_value)
+
+    @staticmethod
+    def _single_assignment(suite):
+        """The assignment of a suite that is just 'name = value', otherwise None"""
+        if suite.data == 'suite':
+            if len(suite.children) != 1:
+                return None
+            suite = suite.children[0]
+        if suite.data != 'assignment_stmt' or suite.children[1].children[0].value != '=':
+            return None
+        if suite.children[0].data != 'var':
+            return None
+        return suite
+
+    def _as_select(self, stmt):
+        """
+        if c: x = a else: x = b with immediates or variables a and b, as the assignment x = a if c else b
+        """
+        if len(stmt.children) != 3:
+            return None
+        test, if_suite, else_suite = stmt.children
+        if_assignment = self._single_assignment(if_suite)
+        else_assignment = self._single_assignment(else_suite)
+        if if_assignment is None or else_assignment is None:
+            return None
+        target = if_assignment.children[0]
+        if target.children[0].value != else_assignment.children[0].children[0].value:
+            return None
+        if_value, else_value = if_assignment.children[2], else_assignment.children[2]
+        if not self._can_select(test, if_value, else_value):
+            return None
+        return Tree('assignment_stmt', [target, if_assignment.children[1], Tree('test', [if_value, test, else_value])])
+
     def test(self, stmt, store_dst=None, **kwargs):
         lst = stmt.children.copy()
 
+        if self._can_select(lst[1], lst[0], lst[2]):
+            # Branchless, dst = condition ? a : b
+            with self.free_register() as s0:
+                r0 = self.visit(lst[1], store_dst=s0)
+            dst = self.cur_stack_dst(store_dst)
+            self._add_instruction(('select', dst, r0, self.visit(lst[0]), self.visit(lst[2])))
+            return dst
+
         n_lst = [lst[1], lst[0], lst[2]]
         self._recursive_if_stmt(n_lst, exit_jump=None, is_expr=True, store_dst=store_dst)
         return store_dst
@@ -218,9 +355,9 @@ class InstBuilder(Visitor):
         else:
             expr = self._update_assignment_expr(id, op, stmt.children[2])
 
-        expr_return_type = LAReturnType(self, expr).return_type
+        expr_facts = self.annotator.facts(expr)
 
-        if isinstance(expr_return_type, Device):
+        if expr_facts.return_type is Device:
             r0 = self.visit(expr, assignment=True)
             self.device_table[stmt.children[0].children[0].value] = r0
             return
@@ -228,7 +365,7 @@ class InstBuilder(Visitor):
             # Get the destination by visit the id.
             dst = self.visit(id, assignment=True)
 
-        expr_can_assign = LACanAssign(self, expr).result
+        expr_can_assign = expr_facts.can_assign
         store_dst = dst if dst in self.idtable.values() else None
         with self.free_register(store_dst=store_dst) as s0:
             t0 = self.visit(expr, store_dst=s0)
@@ -243,16 +380,11 @@ class InstBuilder(Visitor):
             test = stmt_lst[0]
             if_suite = stmt_lst[1]
 
-            can_branch = LACanBranch(self, test).result
-            with self.free_register(can_direct_access=LACanAssign(self, test).result) as t0:
-                con_jump_label = self._create_label() if can_branch else None
-                t0 = self.visit(test, store_dst=t0, branch_dst=con_jump_label)
-            if not can_branch:
-                con_jump_label = self._push_conditional_jump_inst(t0, None, eq=True)
+            con_jump_label = self._branch_if_false(test)
 
             # True
             if is_expr:
-                can_assign = LACanAssign(self, if_suite).result
+                can_assign = self.annotator.facts(if_suite).can_assign
                 with self.free_register(can_direct_access=can_assign, store_dst=store_dst):
                     t0 = self.visit(if_suite, store_dst=store_dst)
                 if not can_assign:
@@ -283,29 +415,49 @@ class InstBuilder(Visitor):
     def while_stmt(self, stmt, store_dst=None):
         test = stmt.children[0]
         suite = stmt.children[1]
+        if self.rotate_loops:
+            self._rotated_while(test, suite)
+            return
         jump_label = self._insert_label()
-        with self.free_register(store_dst=store_dst) as s0:
-            r0 = self.visit(test, store_dst=s0)
-
-        end_jump = self._push_conditional_jump_inst(r0, None, eq=True)
+        end_jump = self._branch_if_false(test)
 
         self.visit(suite)
         self._push_jump_inst(jump_label)
         self._insert_label(end_jump)
 
+    def _rotated_while(self, test, suite):
+        """
+        beq test 0 end; body: suite; bne test 0 body; end:
+        One branch per iteration instead of the test at the top and a jump back to it.
+        """
+        value = self.annotator.facts(test).value
+        if value is not None and value:
+            # while True: a single jump back, no test at all
+            body_label = self._insert_label()
+            self.visit(suite)
+            self._push_jump_inst(body_label)
+            return
+        end_jump = self._branch_if_false(test)
+        body_label = self._insert_label()
+        self.visit(suite)
+        # The test at the bottom gets its own temporaries
+        self._temp_scope += 1
+        self._branch_on(test, body_label, when=True)
+        self._insert_label(end_jump)
+
     def stmt(self, stmt):
         for s in stmt.children:
             self.visit(s)
 
     def suite(self, stmt):
         for s_stmt in stmt.children:
-            self.visit(s_stmt)
+            self._visit_stmt(s_stmt)
 
     def compound_stmt(self, stmt):
         self.visit(stmt.children[0])
 
     def yield_stmt(self, stmt):
-        self._add_instruction('yield', 'yield')
+        self._add_instruction(('yield',))
 
     def reduce_expr(self, tree, store_dst=None, **kwargs):
         lst = tree.children.copy()
@@ -321,22 +473,40 @@ class InstBuilder(Visitor):
             return eval_store
 
     def unary_operator(self, op, right, store_dst=None):
-        with self.free_register(store_dst=store_dst) as s0:
+        with self.operand_register(store_dst=store_dst) as s0:
             r0 = self.visit(right, store_dst=s0)
 
         dst = self.cur_stack_dst(store_dst)
         if op == 'not':
-            self._add_instruction(f'xor {dst} {r0} 1', f'not {r0} -> {dst}')
+            self._add_instruction(('xor', dst, r0, '1'))
 
         return dst
 
-    def operator(self, left, op: Token, right, store_dst=None, branch_dst=None):
+    def _evaluate_operands(self, left, right, store_dst=None):
+        """
+        Evaluate both operands of a binary operation, the one needing more registers first.
+        :return: (r0, r1) registers or immediates holding left and right
+        """
+        # Operands never go to store_dst, so it stays intact while the other operand may still read it,
+        # e.g. a = (b + 1) + a * 2, and loaded values stay available for reuse.
+        # Without store_dst this reserves the result register cur_stack_dst, the operands get the temporaries after it
+        with self.free_register(store_dst=store_dst):
+            if self.rearrange.right_first(left, right):
+                with self.free_register() as s1:
+                    r1 = self.visit(right, store_dst=s1)
+                    with self.free_register() as s0:
+                        r0 = self.visit(left, store_dst=s0)
+                return r0, r1
+
+            with self.free_register() as s0:
+                r0 = self.visit(left, store_dst=s0)
+                with self.free_register(eval_as_const=self.annotator.facts(right).is_const) as s1:
+                    r1 = self.visit(right, store_dst=s1)
+            return r0, r1
 
-        with self.free_register(store_dst=store_dst) as s0:
-            r0 = self.visit(left, store_dst=s0)
-            with self.free_register(eval_as_const=LAIsConst(self, right).result) as s1:
-                r1 = self.visit(right, store_dst=s1)
-                pass
+    def operator(self, left, op: Token, right, store_dst=None, branch_dst=None, branch_when=False):
+
+        r0, r1 = self._evaluate_operands(left, right, store_dst=store_dst)
 
         opper = None
         if op == 'and':
@@ -355,29 +525,25 @@ class InstBuilder(Visitor):
             opper = 'mod'
 
         dst = self.cur_stack_dst(store_dst)
-        if opper:
-            self._add_instruction(f'{opper} {dst} {r0} {r1}', f'{r0} {opper} {r1} -> {dst}')
+        if branch_dst and op in BRANCH_OPCODES:
+            # Jump to branch_dst when the comparison result is branch_when
+            branch = BRANCH_OPCODES[op] if branch_when else INVERSE_BRANCHES[BRANCH_OPCODES[op]]
+            self._add_branch_instruction(compare_branch(branch, r0, r1), branch_dst)
+        elif opper:
+            self._add_instruction((opper, dst, r0, r1))
         else:
-            if branch_dst:
-                branch_str = '{' + str(branch_dst) + '}'
             if op.value == '<':
-                self._add_instruction(f'slt {dst} {r0} {r1}', f'{r0} < {r1} -> {dst}')
+                self._add_instruction(('slt', dst, r0, r1))
             elif op.value == '>':
-                self._add_instruction(f'sgt {dst} {r0} {r1}', f'{r0} < {r1} -> {dst}')
+                self._add_instruction(('sgt', dst, r0, r1))
             elif op.value == '<=':
-                self._add_instruction(f'sle {dst} {r0} {r1}', f'{r0} <= {r1} -> {dst}')
+                self._add_instruction(('sle', dst, r0, r1))
             elif op.value == '>=':
-                self._add_instruction(f'sge {dst} {r0} {r1}', f'{r0} <= {r1} -> {dst}')
+                self._add_instruction(('sge', dst, r0, r1))
             elif op.value == '==':
-                if branch_dst:
-                    self._add_instruction(f'bne {r0} {r1} {branch_str} ', f'Jump to {branch_str} iff {r0} != {r1}')
-                else:
-                    self._add_instruction(f'seq {dst} {r0} {r1}', f'{r0} == {r1} -> {dst}')
+                self._add_instruction(('seq', dst, r0, r1))
             elif op.value == '!=':
-                if branch_dst:
-                    self._add_instruction(f'beq {r0} {r1} {branch_str} ', f'Jump to {branch_str} iff {r0} == {r1}')
-                else:
-                    self._add_instruction(f'sne {dst} {r0} {r1}', f'{r0} != {r1} -> {dst}')
+                self._add_instruction(('sne', dst, r0, r1))
         return dst
 
     def subscriptlist(self, expr, store_dst=None):
@@ -437,36 +603,30 @@ class InstBuilder(Visitor):
 
             left = arguments[0] if function.no_args >= 1 else None
             right = arguments[1] if function.no_args == 2 else None
-            with self.free_register(store_dst=store_dst) as s0:
-                if not left:
-                    if function.returns:
-                        self._add_instruction(f'{function.inst} {dst}',
-                                              f'{function.inst} -> {dst}')
-                        return dst
-                    else:
-                        raise MipsCodeError("no return and no argument function")
+            if not left:
+                if function.returns:
+                    self._add_instruction((function.inst, dst))
+                    return dst
+                else:
+                    raise MipsCodeError("no return and no argument function")
 
-                r0 = self.visit(left, store_dst=s0)
-                if right:
-                    with self.free_register(eval_as_const=LAIsConst(self, right).result) as s1:
-                        r1 = self.visit(right, store_dst=s1)
-                        if function.returns:
-                            self._add_instruction(f'{function.inst} {dst} {r0} {r1}',
-                                                  f'{function.inst}({r0}, {r1}) -> {dst}')
-                            return dst
-                        else:
-                            self._add_instruction(f'{function.inst} {r0} {r1}',
-                                                  f'{function.inst}({r0}, {r1})')
-                            return "0"
+            if right:
+                r0, r1 = self._evaluate_operands(left, right, store_dst=store_dst)
+                if function.returns:
+                    self._add_instruction((function.inst, dst, r0, r1))
+                    return dst
+                else:
+                    self._add_instruction((function.inst, r0, r1))
+                    return "0"
+            else:
+                with self.operand_register(store_dst=store_dst) as s0:
+                    r0 = self.visit(left, store_dst=s0)
+                if function.returns:
+                    self._add_instruction((function.inst, dst, r0))
+                    return dst
                 else:
-                    if function.returns:
-                        self._add_instruction(f'{function.inst} {dst} {r0}',
-                                              f'{function.inst}({r0}) -> {dst}')
-                        return dst
-                    else:
-                        self._add_instruction(f'{function.inst} {r0}',
-                                              f'{function.inst}({r0})')
-                        return "0"
+                    self._add_instruction((function.inst, r0))
+                    return "0"
         raise Exception("ERROR CALL")
 
     def attr_get(self, expr, store_dst=None, **kwargs):
@@ -515,20 +675,18 @@ class InstBuilder(Visitor):
         prop_str = prop.value
         if device not in self.device_table.values():
             raise MipsAttributeError(device, prop_str)
-        self._add_instruction(f'l {dst} {device.device} {prop_str}', f'load {device.device} {prop_str} to {dst}')
+        self._add_instruction(('l', dst, device.device, prop_str))
 
     def _load_reagent(self, dst, device: Device, mode_str: str, reagent_str: str):
         if device not in self.device_table.values():
             raise MipsAttributeError(device, mode_str)
-        self._add_instruction(f'lr {dst} {device.device} {mode_str} {reagent_str}',
-                              f'load reagent {device.device} {mode_str} {reagent_str} to {dst}')
+        self._add_instruction(('lr', dst, device.device, mode_str, reagent_str))
 
     def _load_attr_slot(self, dst, device: Device, prop: str, slot):
-        self._add_instruction(f'ls {dst} {device.device} {slot} {prop}',
-                              f'load {device.device} {prop}[{slot}] to {dst}')
+        self._add_instruction(('ls', dst, device.device, slot, prop))
 
     def _save_attr(self, var, device: Device, prop: str):
         if prop.startswith("Reagent"):
             # Special case for Reagent where we cant assign
             raise MipsAttributeCantSetError(prop)
-        self._add_instruction(f's {device.device} {prop} {var}', f'save {var} to {device.device} {prop}')
+        self._add_instruction(('s', device.device, prop, var))
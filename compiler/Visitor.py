@@ -1,11 +1,24 @@
+import inspect
+
+from compiler.exceptions import MipsNotSupportedError
 from compiler.types import Function, Device, FunctionBuiltIn
 
 
 class Visitor:
+    # rule name -> function, built once per class by __init_subclass__
+    _dispatch = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._dispatch = {name: member for name, member in inspect.getmembers(cls, inspect.isfunction)
+                         if not name.startswith('_') and name != 'visit'}
 
     def visit(self, node, **kwargs):
-        f = getattr(self, node.data)
-        return f(node, **kwargs)
+        try:
+            f = self._dispatch[node.data]
+        except KeyError:
+            raise MipsNotSupportedError(node.data) from None
+        return f(self, node, **kwargs)
 
 
 class CompileEnv(Visitor):
@@ -0,0 +1,64 @@
+import hashlib
+import os
+from pathlib import Path
+
+COMPILER_DIR = Path(__file__).parent
+
+_fingerprint = None
+
+
+def compiler_fingerprint() -> str:
+    """
+    Hash of the grammar and the compiler sources, any change to the compiler invalidates the cache
+    """
+    global _fingerprint
+    if _fingerprint is None:
+        digest = hashlib.sha256()
+        for file in sorted(COMPILER_DIR.glob('*.py')) + [COMPILER_DIR / 'gramma']:
+            digest.update(file.name.encode('utf8'))
+            digest.update(file.read_bytes())
+        _fingerprint = digest.hexdigest()
+    return _fingerprint
+
+
+class BuildCache:
+    """
+    Content addressed store of compiler output, one file per key in directory
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+
+    def key(self, src: str, debug=False, rotate_loops=False) -> str:
+        digest = hashlib.sha256()
+        digest.update(compiler_fingerprint().encode('utf8'))
+        digest.update(b'debug' if debug else b'release')
+        if rotate_loops:
+            digest.update(b'rotate_loops')
+        digest.update(src.encode('utf8'))
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f'{key}.mips'
+
+    def get(self, key: str):
+        try:
+            return self._path(key).read_text()
+        except OSError:
+            return None
+
+    def put(self, key: str, output: str):
+        path = self._path(key)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(f'.{os.getpid()}.tmp')
+            tmp.write_text(output)
+            os.replace(tmp, path)
+        except OSError:
+            # A cache we can't write to only costs us a recompile next time
+            pass
+
+
+def format_stats(results) -> str:
+    hits = sum(1 for result in results if result.cached)
+    return f'build cache: {hits} hits, {len(results) - hits} misses'
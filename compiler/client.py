@@ -0,0 +1,12 @@
+import json
+import socket
+
+
+# Keep the imports light, the client should start without loading lark or the compiler.
+def request(path, payload: dict) -> dict:
+    """Send one request to a server started with serve_unix and return its response"""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(path)
+        sock.sendall(json.dumps(payload).encode('utf8') + b'\n')
+        with sock.makefile('rb') as fd:
+            return json.loads(fd.readline())
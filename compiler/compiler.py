@@ -1,11 +1,21 @@
 import os
+from concurrent.futures import ProcessPoolExecutor
 from contextlib import contextmanager
+from itertools import repeat
 
 import sys
 from pathlib import Path
 
 from compiler.InstBuilder import InstBuilder
-from compiler.exceptions import MipsSyntaxError, MipsException
+from compiler.build_cache import BuildCache
+from compiler.device_stores import eliminate_stores
+from compiler.exceptions import MipsSyntaxError, MipsException, MipsCodeError
+from compiler.instruction import describe
+from compiler.loop_invariants import hoist_invariants
+from compiler.peephole import Peephole
+from compiler.register_allocator import RegisterAllocator, is_physical
+from compiler.tick_budget import TickBudget
+from compiler.value_numbering import number_values
 
 try:
     from lark import Lark, Tree
@@ -17,9 +27,14 @@ except ImportError:
     print('Missing Module lark install with pip \"pip install lark-parser\"')
     sys.exit(1)
 
+GRAMMAR_FILE = Path(__file__).parent / 'gramma'
+# Serialized LALR tables live next to the grammar. Lark stores a hash of the
+# grammar and options in the file and rebuilds it when they no longer match.
+PARSER_CACHE_FILE = Path(__file__).parent / 'gramma.cache'
+
 grammar = None
 
-with open(Path(__file__).parent / 'gramma', 'r') as fd:
+with open(GRAMMAR_FILE, 'r') as fd:
     grammar = fd.read()
 
 
@@ -32,13 +47,44 @@ class TreeIndenter(Indenter):
     tab_len = 4
 
 
+_parser = None
+
+
+def get_parser():
+    """
+    Return the process wide parser, building it on first use.
+    A cold start loads the serialized tables from PARSER_CACHE_FILE when present.
+    """
+    global _parser
+    if _parser is None:
+        try:
+            _parser = Lark(grammar, start='root', parser='lalr', postlex=TreeIndenter(),
+                           cache=str(PARSER_CACHE_FILE))
+        except OSError:
+            # Read only install, build the tables in memory instead
+            _parser = Lark(grammar, start='root', parser='lalr', postlex=TreeIndenter())
+    return _parser
+
+
+def format_inst(inst) -> str:
+    return ' '.join(inst)
+
+
 class Compiler:
-    def __init__(self, debug=False):
+    def __init__(self, debug=False, skip_unchanged_stores=False, rotate_loops=False):
+        """
+        :param skip_unchanged_stores: drop device stores of the value an earlier store already wrote, assumes
+                                      nothing else writes the device properties the script sets
+        :param rotate_loops: test while conditions at the bottom of the loop, one branch less per iteration
+                             for a copy of the test in front of the loop
+        """
         self.debug = debug
+        self.skip_unchanged_stores = skip_unchanged_stores
+        self.rotate_loops = rotate_loops
         self.final_program = []
 
     def compile(self, program):
-        parser = Lark(grammar, start='root', parser='lalr', postlex=TreeIndenter())
+        parser = get_parser()
         try:
             tree = parser.parse(program + os.linesep)
         except lark_exceptions.UnexpectedToken as exc:
@@ -49,65 +95,170 @@ class Compiler:
 
         if self.debug:
             print(tree)
-        builder = InstBuilder()
+        builder = InstBuilder(rotate_loops=self.rotate_loops)
         builder.visit(tree)
 
-        self.program = builder.program
-        self.labels = builder.labels
+        # The builder emits virtual registers
+        program, labels, fixups, self.hoisted = hoist_invariants(
+            builder.program, builder.labels, builder.fixups, builder.idtable.values())
+        program, self.reused_values = number_values(program, labels, fixups)
+        self.virtual_program, labels, fixups, self.dropped_stores = eliminate_stores(
+            program, labels, fixups, self.skip_unchanged_stores)
+        allocator = RegisterAllocator(self.virtual_program, labels, fixups, builder.idtable.values())
+        program, _ = allocator.allocate()
+
+        peephole = Peephole(is_register=is_physical, live_at_exit=allocator.variable_registers())
+        # Spilling inserts stack instructions, take the labels of the rewritten program
+        self.program, self.labels = peephole.run(program, allocator.labels)
+        self.fixups = peephole.fixups()
+        self.peephole_hits = peephole.hits
+        self.idtable = {name: allocator.location(register) for name, register in builder.idtable.items()}
         self.resolve_labels()
         self.validate()
-        return "\n".join([f'{line:25} // {i:2}: {desc}' for i, (line, desc) in enumerate(self.final_program)])
+        return self.format_program(annotate=self.debug)
 
     def resolve_labels(self):
+        """
+        Patch the label operands recorded in fixups with the label line numbers, other instructions are left untouched
+        """
+        self.final_program = list(self.program)
+        for index, slot, label in self.fixups:
+            inst = self.final_program[index]
+            self.final_program[index] = inst[:slot] + (str(self.labels[label]),) + inst[slot + 1:]
 
-        for line, desc in self.program:
-            line = line.format(**self.labels)
-            desc = desc.format(**self.labels)
-            self.final_program.append((line, desc))
+    def format_program(self, annotate=False) -> str:
+        """
+        :param annotate: append the line number and a description to every instruction
+        """
+        if annotate:
+            return "\n".join([f'{format_inst(inst):25} // {i:2}: {describe(inst)}'
+                              for i, inst in enumerate(self.final_program)])
+        return "\n".join([format_inst(inst) for inst in self.final_program])
+
+    def tick_report(self):
+        """
+        :return: the worst case instruction count between the yield/sleep points of the compiled program,
+                 see compiler.tick_budget.TickBudget.report
+        """
+        return TickBudget(self.program, self.labels, self.fixups).report()
 
     def validate(self):
         if len(self.final_program) > 127:
-            raise Exception(f"program to large {len(self.final_program)} > 127")
+            raise MipsCodeError(f"program to large {len(self.final_program)} > 127")
 
 
-def compile_file(file: Path, debug=False):
-    file_o = Path(f'{file}.mips')
-    with file.open('r') as fd_r, file_o.open('w') as fd_w:
-        output = compile_src(fd_r.read(), debug)
+class CompileResult:
+    def __init__(self, file: Path, output: str, error: str = None, cached=False):
+        self.file = file
+        self.output = output
+        self.error = error
+        self.cached = cached
+
+
+def _write_output(file_o: Path, output: str):
+    """Write output unless file_o already holds it, so unchanged outputs keep their mtime"""
+    try:
+        if file_o.read_text() == output:
+            return
+    except OSError:
+        pass
+    with file_o.open('w') as fd_w:
         fd_w.write(output)
-        print(output)
 
 
-def compile_src(src: str, debug=False):
+def _compile_file(file: Path, debug=False, cache: BuildCache = None, rotate_loops=False) -> CompileResult:
+    file_o = Path(f'{file}.mips')
     try:
-        compiler = Compiler(debug=debug)
-        compiler.compile(src)
-
-        output = ""
-        if debug:
-
-            output += "Begin Python**************************\n"
-            output = src.strip() + '\n'
-            output += "End Python*****************************\n"
-
-            output += "IDTable******************************\n"
-            output += "\n".join([f'{key} ==> {value}' for key, value in compiler.idtable.items()])
-            output += "\n"
-            output += "JumpTable******************************\n"
-            output += "\n".join([f'{key} ==> {value}' for key, value in compiler.labels.items()])
-            output += "\n"
-            for i, (line, desc) in enumerate(compiler.program):
-                output += f'{line:35} {i:2}: {desc}\n'
-
-            output += "MIPS***********************************\n"
-            for i, (line, desc) in enumerate(compiler.final_program):
-                output += f'{line:35} {i:2}: {desc}\n'
-
-        else:
-            for i, (line, desc) in enumerate(compiler.final_program):
-                output += f'{line}\n'
+        # Unreadable or undecodable sources fail this file only
+        with file.open('r') as fd_r:
+            src = fd_r.read()
+    except (OSError, UnicodeDecodeError) as exc:
+        _write_output(file_o, str(exc))
+        return CompileResult(file, str(exc), str(exc))
+
+    key = cache.key(src, debug, rotate_loops) if cache else None
+    output = cache.get(key) if cache else None
+    if output is not None:
+        _write_output(file_o, output)
+        return CompileResult(file, output, cached=True)
+
+    try:
+        output = error = None
+        output = _compile_src(src, debug, rotate_loops)
+    except Exception as exc:
+        output = error = str(exc)
+    if cache and not error:
+        cache.put(key, output)
+    _write_output(file_o, output)
+    return CompileResult(file, output, error)
+
+
+def compile_file(file: Path, debug=False, cache: BuildCache = None, rotate_loops=False) -> CompileResult:
+    result = _compile_file(file, debug, cache, rotate_loops)
+    print(result.output)
+    return result
+
+
+def compile_files(files, debug=False, jobs=1, cache: BuildCache = None, rotate_loops=False):
+    """
+    Compile every file into <file>.mips, errors in one file do not stop the others.
+    :param jobs: number of worker processes, each keeps its own warm parser
+    :param cache: reuse the output of files whose source and compiler are unchanged
+    :param rotate_loops: see Compiler
+    :return: CompileResult for each file in the order of files
+    """
+    files = list(files)
+    if jobs <= 1 or len(files) <= 1:
+        return [_compile_file(file, debug, cache, rotate_loops) for file in files]
+    with ProcessPoolExecutor(max_workers=jobs, initializer=get_parser) as executor:
+        return list(executor.map(_compile_file, files, repeat(debug), repeat(cache), repeat(rotate_loops)))
+
+
+def compile_src(src: str, debug=False, rotate_loops=False):
+    try:
+        return _compile_src(src, debug, rotate_loops)
     except MipsException as exc:
         return str(exc)
     except Exception as exc:
         return str(exc)
+
+
+def _compile_src(src: str, debug=False, rotate_loops=False):
+    compiler = Compiler(debug=debug, rotate_loops=rotate_loops)
+    compiler.compile(src)
+
+    output = ""
+    if debug:
+
+        output += "Begin Python**************************\n"
+        output += src.strip() + '\n'
+        output += "End Python*****************************\n"
+
+        output += "IDTable******************************\n"
+        output += "\n".join([f'{key} ==> {value}' for key, value in compiler.idtable.items()])
+        output += "\n"
+        output += "Peephole******************************\n"
+        output += "\n".join([f'{rule} ==> {hits}' for rule, hits in compiler.peephole_hits.most_common()])
+        output += "\n"
+        output += "Hoisted******************************\n"
+        output += "\n".join([f'{kind} ==> {hits}' for kind, hits in compiler.hoisted.most_common()])
+        output += "\n"
+        output += "Reused values*************************\n"
+        output += "\n".join([f'{kind} ==> {hits}' for kind, hits in compiler.reused_values.most_common()])
+        output += "\n"
+        output += "Dropped stores************************\n"
+        output += "\n".join([f'{kind} ==> {hits}' for kind, hits in compiler.dropped_stores.most_common()])
+        output += "\n"
+        output += "JumpTable******************************\n"
+        output += "\n".join([f'{key} ==> {value}' for key, value in compiler.labels.items()])
+        output += "\n"
+        for i, inst in enumerate(compiler.virtual_program):
+            output += f'{format_inst(inst):35} {i:2}: {describe(inst)}\n'
+
+        output += "MIPS***********************************\n"
+        for i, inst in enumerate(compiler.final_program):
+            output += f'{format_inst(inst):35} {i:2}: {describe(inst)}\n'
+
+    else:
+        output = compiler.format_program()
     return output.strip()
@@ -0,0 +1,136 @@
+"""
+Device store elimination over the virtual program.
+
+A store is dead when every path from it writes the same device property again before anything can observe
+the first value: a load of the property, a yield or sleep, a loop head where the tick may end because the
+instruction budget runs out, or the end of the program.
+
+Optionally a store is also skipped when the property provably still holds the stored value, written by an
+earlier store on every path, possibly in a previous tick. This assumes nothing else writes the property, a
+player or another chip toggling the device is not seen, so it is off by default.
+"""
+from collections import Counter
+
+from compiler.flow import successors, predecessors, remove_instructions
+from compiler.instruction import defs
+
+LOADS = {'l', 'lr', 'ls'}
+# Time passes, the game reads the device values
+TICK_OPS = {'yield', 'sleep'}
+
+
+class DeviceStores:
+    """
+    :param skip_unchanged: also drop stores of the value the property already holds
+    """
+
+    def __init__(self, program, labels, fixups, skip_unchanged=False):
+        self.program = program
+        self.labels = labels
+        self.fixups = fixups
+        self.skip_unchanged = skip_unchanged
+        self.succ = successors(program, labels, fixups)
+        self.pred = predecessors(self.succ)
+        self.hits = Counter()
+        # Loop heads, the targets of backward edges
+        self.loop_heads = {j for i, nxt in enumerate(self.succ) for j in nxt if j <= i}
+
+    def _overwritten_before(self, i, overwritten):
+        """Backward transfer, the (device, property) pairs written again before being observed"""
+        inst = self.program[i]
+        op = inst[0]
+        if op in TICK_OPS or i in self.loop_heads:
+            return set()
+        if op in LOADS:
+            return {pair for pair in overwritten if pair[0] != inst[2]}
+        if op == 's':
+            return overwritten | {(inst[1], inst[2])}
+        return overwritten
+
+    def dead_stores(self):
+        """
+        Must analysis, the program end and instructions not analysed yet overwrite nothing
+        :return: indexes of the stores overwritten on every path
+        """
+        n = len(self.program)
+        # None is the top of the lattice, every pair is overwritten
+        overwritten_in = [None] * n
+        changed = True
+        while changed:
+            changed = False
+            for i in reversed(range(n)):
+                reaching = [set() if j >= n else overwritten_in[j] for j in self.succ[i]]
+                reaching = [pairs for pairs in reaching if pairs is not None]
+                out = set.intersection(*reaching) if reaching else set()
+                new_in = self._overwritten_before(i, out)
+                if new_in != overwritten_in[i]:
+                    overwritten_in[i] = new_in
+                    changed = True
+
+        dead = set()
+        for i, inst in enumerate(self.program):
+            if inst[0] != 's':
+                continue
+            following = [set() if j >= n else overwritten_in[j] or set() for j in self.succ[i]]
+            if following and all((inst[1], inst[2]) in pairs for pairs in following):
+                dead.add(i)
+        return dead
+
+    def _stored_after(self, i, stored):
+        """Forward transfer, the (device, property, value) triples the devices hold"""
+        inst = self.program[i]
+        if inst[0] == 's':
+            stored = {fact for fact in stored if fact[:2] != inst[1:3]} | {inst[1:4]}
+        for register in defs(inst):
+            stored = {fact for fact in stored if fact[2] != register}
+        return stored
+
+    def unchanged_stores(self):
+        """
+        Must analysis, nothing is known at the start of the program
+        :return: indexes of the stores of the value the property already holds
+        """
+        n = len(self.program)
+        # None is the top of the lattice, not reached yet
+        stored_in = [None] * n
+        stored_out = [None] * n
+        changed = True
+        while changed:
+            changed = False
+            for i in range(n):
+                if i == 0 or not self.pred[i]:
+                    entry = set()
+                else:
+                    reaching = [stored_out[p] for p in self.pred[i] if stored_out[p] is not None]
+                    if not reaching:
+                        continue
+                    entry = set.intersection(*reaching)
+                out = self._stored_after(i, entry)
+                if entry != stored_in[i] or out != stored_out[i]:
+                    stored_in[i], stored_out[i] = entry, out
+                    changed = True
+        return {i for i, inst in enumerate(self.program)
+                if inst[0] == 's' and stored_in[i] is not None and inst[1:4] in stored_in[i]}
+
+    def run(self):
+        """
+        :return: (program, labels, fixups) without the dropped stores
+        """
+        removed = self.dead_stores()
+        self.hits['dead'] += len(removed)
+        if self.skip_unchanged:
+            # Dead stores go first, s On 1; s On 1 must keep one of the two stores
+            program, labels, fixups = remove_instructions(self.program, self.labels, self.fixups, removed)
+            remaining = DeviceStores(program, labels, fixups)
+            unchanged = remaining.unchanged_stores()
+            self.hits['unchanged'] += len(unchanged)
+            return remove_instructions(program, labels, fixups, unchanged)
+        return remove_instructions(self.program, self.labels, self.fixups, removed)
+
+
+def eliminate_stores(program, labels, fixups, skip_unchanged=False):
+    """
+    :return: (program, labels, fixups, hits per kind of dropped store)
+    """
+    stores = DeviceStores(program, labels, fixups, skip_unchanged)
+    return stores.run() + (stores.hits,)
@@ -8,6 +8,11 @@ class MipsSyntaxError(MipsException):
     pass
 
 
+class MipsNotSupportedError(MipsSyntaxError):
+    def __init__(self, rule):
+        super().__init__(f"SyntaxError: '{rule}' is not supported")
+
+
 class MipsCodeError(MipsException):
     pass
 
@@ -0,0 +1,90 @@
+from compiler.instruction import defs, uses, is_jump, is_branch, branch_taken
+
+
+def successors(program, labels, fixups):
+    """
+    Control flow graph of program at instruction level.
+    Branches on constant conditions, e.g. the test of 'while True', only get the edge they take.
+    :return: list with the successor indexes of every instruction, len(program) is the exit
+    """
+    targets = {index: labels[label] for index, _, label in fixups}
+    succ = []
+    for i, inst in enumerate(program):
+        taken = branch_taken(inst)
+        nxt = [] if is_jump(inst) or taken else [i + 1]
+        if is_branch(inst) and i in targets and taken is not False and targets[i] not in nxt:
+            nxt.append(targets[i])
+        succ.append(nxt)
+    return succ
+
+
+def predecessors(succ):
+    pred = [[] for _ in range(len(succ) + 1)]
+    for i, nxt in enumerate(succ):
+        for j in nxt:
+            pred[j].append(i)
+    return pred
+
+
+def loop_depth(succ):
+    """
+    Loop nesting depth of every instruction, the code is structured so a backward edge closes a loop
+    :return: list with the depth of every instruction
+    """
+    depth = [0] * len(succ)
+    for i, nxt in enumerate(succ):
+        for j in nxt:
+            if j <= i:
+                for k in range(j, i + 1):
+                    depth[k] += 1
+    return depth
+
+
+def liveness(program, succ, is_register, live_at_exit=()):
+    """
+    Backward dataflow over the registers accepted by is_register.
+    :param live_at_exit: registers that are observed when the program ends
+    :return: (live_in, live_out) list of sets for every instruction
+    """
+    n = len(program)
+    inst_defs = [set(filter(is_register, defs(inst))) for inst in program]
+    inst_uses = [set(filter(is_register, uses(inst))) for inst in program]
+    exit_live = set(live_at_exit)
+    live_in = [set() for _ in range(n)]
+    live_out = [set() for _ in range(n)]
+    pred = predecessors(succ)
+
+    worklist = list(range(n))
+    pending = set(worklist)
+    while worklist:
+        i = worklist.pop()
+        pending.discard(i)
+        out = set()
+        for j in succ[i]:
+            out |= exit_live if j >= n else live_in[j]
+        live_out[i] = out
+        new_in = inst_uses[i] | (out - inst_defs[i])
+        if new_in != live_in[i]:
+            live_in[i] = new_in
+            for p in pred[i]:
+                if p not in pending:
+                    pending.add(p)
+                    worklist.append(p)
+    return live_in, live_out
+
+
+def remove_instructions(program, labels, fixups, removed):
+    """
+    Delete the instructions at the indexes in removed, a label on a removed instruction moves to the next one
+    :return: (program, labels, fixups)
+    """
+    positions = []
+    kept = []
+    for i, inst in enumerate(program):
+        positions.append(len(kept))
+        if i not in removed:
+            kept.append(inst)
+    positions.append(len(kept))
+    labels = {label: positions[index] for label, index in labels.items()}
+    fixups = [(positions[index], slot, label) for index, slot, label in fixups if index not in removed]
+    return kept, labels, fixups
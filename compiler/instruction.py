@@ -0,0 +1,317 @@
+"""
+Instructions are stored as tuples of opcode and operands, e.g. ('add', 'r0', 'r1', '2').
+Human readable descriptions are only created on demand for debug output.
+"""
+import math
+import operator
+from decimal import Decimal
+
+DESCRIPTIONS = {
+    'alias': 'alias {1} {2}',
+    'yield': 'yield',
+    'move': '{2} -> {1}',
+    'select': '{3} if {2} else {4} -> {1}',
+    'j': 'Jump to {1}',
+    'beq': 'Jump to {3} iff {1} == {2}',
+    'bne': 'Jump to {3} iff {1} != {2}',
+    'blt': 'Jump to {3} iff {1} < {2}',
+    'bgt': 'Jump to {3} iff {1} > {2}',
+    'ble': 'Jump to {3} iff {1} <= {2}',
+    'bge': 'Jump to {3} iff {1} >= {2}',
+    'beqz': 'Jump to {2} iff {1} == 0',
+    'bnez': 'Jump to {2} iff {1} != 0',
+    'bltz': 'Jump to {2} iff {1} < 0',
+    'bgtz': 'Jump to {2} iff {1} > 0',
+    'blez': 'Jump to {2} iff {1} <= 0',
+    'bgez': 'Jump to {2} iff {1} >= 0',
+    'and': '{2} and {3} -> {1}',
+    'or': '{2} or {3} -> {1}',
+    'xor': '{2} xor {3} -> {1}',
+    'add': '{2} + {3} -> {1}',
+    'sub': '{2} - {3} -> {1}',
+    'mul': '{2} * {3} -> {1}',
+    'div': '{2} / {3} -> {1}',
+    'mod': 'mod({2}, {3}) -> {1}',
+    'slt': '{2} < {3} -> {1}',
+    'sgt': '{2} > {3} -> {1}',
+    'sle': '{2} <= {3} -> {1}',
+    'sge': '{2} >= {3} -> {1}',
+    'seq': '{2} == {3} -> {1}',
+    'sne': '{2} != {3} -> {1}',
+    'l': 'load {2} {3} to {1}',
+    'lr': 'load reagent {2} {3} {4} to {1}',
+    'ls': 'load {2} {4}[{3}] to {1}',
+    's': 'save {3} to {1} {2}',
+    'min': 'min({2}, {3}) -> {1}',
+    'max': 'max({2}, {3}) -> {1}',
+    'rand': 'rand -> {1}',
+    'sleep': 'sleep({1})',
+    'push': 'push {1} to stack[sp++]',
+    'pop': 'pop stack[--sp] to {1}',
+    'peek': 'peek stack[sp - 1] to {1}',
+}
+
+for _op in ['abs', 'asin', 'acos', 'sin', 'cos', 'tan', 'exp', 'floor', 'ceil', 'trunc', 'log', 'round', 'sqrt']:
+    DESCRIPTIONS[_op] = _op + '({2}) -> {1}'
+
+
+def describe(inst) -> str:
+    fmt = DESCRIPTIONS.get(inst[0])
+    if fmt is None:
+        return ' '.join(inst)
+    return fmt.format(*inst)
+
+
+# Operand kinds per opcode: 'w' register written, 'r' value read (register or immediate),
+# 'l' label and 'n' a name such as a device, property or alias
+OPERANDS = {
+    'alias': 'nn',
+    'yield': '',
+    'move': 'wr',
+    'select': 'wrrr',
+    'j': 'l',
+    'beq': 'rrl',
+    'bne': 'rrl',
+    'blt': 'rrl',
+    'bgt': 'rrl',
+    'ble': 'rrl',
+    'bge': 'rrl',
+    'beqz': 'rl',
+    'bnez': 'rl',
+    'bltz': 'rl',
+    'bgtz': 'rl',
+    'blez': 'rl',
+    'bgez': 'rl',
+    'l': 'wnn',
+    'lr': 'wnnn',
+    'ls': 'wnrn',
+    's': 'nnr',
+    'rand': 'w',
+    'sleep': 'r',
+    # The stack instructions also use and update sp
+    'push': 'r',
+    'pop': 'w',
+    'peek': 'w',
+}
+
+for _op in ['and', 'or', 'xor', 'add', 'sub', 'mul', 'div', 'mod', 'slt', 'sgt', 'sle', 'sge', 'seq', 'sne',
+            'min', 'max']:
+    OPERANDS[_op] = 'wrr'
+
+for _op in ['abs', 'asin', 'acos', 'sin', 'cos', 'tan', 'exp', 'floor', 'ceil', 'trunc', 'log', 'round', 'sqrt']:
+    OPERANDS[_op] = 'wr'
+
+
+def defs(inst):
+    """Operands written by inst"""
+    return [inst[i + 1] for i, kind in enumerate(OPERANDS.get(inst[0], '')) if kind == 'w']
+
+
+def uses(inst):
+    """Operands read by inst, registers and immediates"""
+    return [inst[i + 1] for i, kind in enumerate(OPERANDS.get(inst[0], '')) if kind == 'r']
+
+
+def rename(inst, mapping):
+    """Copy of inst with its register operands replaced through mapping"""
+    kinds = OPERANDS.get(inst[0], '')
+    return (inst[0],) + tuple(mapping.get(operand, operand) if i < len(kinds) and kinds[i] in 'wr' else operand
+                              for i, operand in enumerate(inst[1:]))
+
+
+def is_jump(inst) -> bool:
+    """Unconditional jump, execution never continues with the next instruction"""
+    return inst[0] == 'j'
+
+
+def is_branch(inst) -> bool:
+    """Instruction with a label operand"""
+    return 'l' in OPERANDS.get(inst[0], '')
+
+
+BRANCH_CONDITIONS = {
+    'beq': operator.eq,
+    'bne': operator.ne,
+    'blt': operator.lt,
+    'bgt': operator.gt,
+    'ble': operator.le,
+    'bge': operator.ge,
+    'beqz': lambda a: a == 0,
+    'bnez': lambda a: a != 0,
+    'bltz': lambda a: a < 0,
+    'bgtz': lambda a: a > 0,
+    'blez': lambda a: a <= 0,
+    'bgez': lambda a: a >= 0,
+}
+
+
+def _immediate(operand):
+    try:
+        return float(operand)
+    except ValueError:
+        return None
+
+
+def branch_taken(inst):
+    """
+    :return: True or False when the branch condition only compares immediates, None when it depends on registers
+    """
+    condition = BRANCH_CONDITIONS.get(inst[0])
+    if condition is None:
+        return None
+    values = [_immediate(operand) for operand in uses(inst)]
+    if None in values:
+        return None
+    return condition(*values)
+
+
+# Branch taken exactly when the key is not taken
+INVERSE_BRANCHES = {
+    'beq': 'bne',
+    'bne': 'beq',
+    'blt': 'bge',
+    'bge': 'blt',
+    'bgt': 'ble',
+    'ble': 'bgt',
+    'beqz': 'bnez',
+    'bnez': 'beqz',
+    'bltz': 'bgez',
+    'bgez': 'bltz',
+    'bgtz': 'blez',
+    'blez': 'bgtz',
+}
+
+# Branch comparing with zero
+ZERO_BRANCHES = {
+    'beq': 'beqz',
+    'bne': 'bnez',
+    'blt': 'bltz',
+    'bgt': 'bgtz',
+    'ble': 'blez',
+    'bge': 'bgez',
+}
+
+# Same branch with its operands swapped
+SWAPPED_BRANCHES = {
+    'beq': 'beq',
+    'bne': 'bne',
+    'blt': 'bgt',
+    'bgt': 'blt',
+    'ble': 'bge',
+    'bge': 'ble',
+}
+
+# Comparison operators of the source language and the branches taken when they hold
+BRANCH_OPCODES = {
+    '<': 'blt',
+    '>': 'bgt',
+    '<=': 'ble',
+    '>=': 'bge',
+    '==': 'beq',
+    '!=': 'bne',
+}
+
+
+def compare_branch(op, a, b):
+    """
+    Branch jumping when 'a op b' holds, without its label. Comparisons with 0 use the zero compare form.
+    """
+    if a == '0' and b != '0':
+        op, a, b = SWAPPED_BRANCHES[op], b, a
+    if b == '0':
+        return ZERO_BRANCHES[op], a
+    return op, a, b
+
+
+def label_slot(inst):
+    """Index in inst of the label operand, None for instructions without one"""
+    kinds = OPERANDS.get(inst[0], '')
+    return kinds.index('l') + 1 if 'l' in kinds else None
+
+
+# Python operators of the source language and the opcodes computing them
+OPERATOR_OPCODES = {
+    '+': 'add',
+    '-': 'sub',
+    '*': 'mul',
+    '/': 'div',
+    '%': 'mod',
+    '<': 'slt',
+    '>': 'sgt',
+    '<=': 'sle',
+    '>=': 'sge',
+    '==': 'seq',
+    '!=': 'sne',
+}
+
+
+def _logical(fn):
+    # Only fold logic on 0 and 1, the VM and the game disagree on other values
+    return lambda a, b: float(fn(bool(a), bool(b))) if {a, b} <= {0.0, 1.0} else None
+
+
+def _mod(a, b):
+    # Python takes the sign of b, the game may not, only fold where every convention agrees
+    return operator.mod(a, b) if a >= 0 and b > 0 else None
+
+
+def _round(a):
+    # Python rounds halves to even, the game may round them away from zero, leave halves to the game
+    return round(a) if abs(a - math.trunc(a)) != 0.5 else None
+
+
+# Compile time evaluation of the instructions without side effects
+EVALUATE = {
+    'add': operator.add,
+    'sub': operator.sub,
+    'mul': operator.mul,
+    'div': operator.truediv,
+    'mod': _mod,
+    'slt': operator.lt,
+    'sgt': operator.gt,
+    'sle': operator.le,
+    'sge': operator.ge,
+    'seq': operator.eq,
+    'sne': operator.ne,
+    'and': _logical(operator.and_),
+    'or': _logical(operator.or_),
+    'xor': _logical(operator.xor),
+    'min': min,
+    'max': max,
+    'abs': abs,
+    'asin': math.asin,
+    'acos': math.acos,
+    'sin': math.sin,
+    'cos': math.cos,
+    'tan': math.tan,
+    'exp': math.exp,
+    'floor': math.floor,
+    'ceil': math.ceil,
+    'trunc': math.trunc,
+    'log': math.log,
+    'round': _round,
+    'sqrt': math.sqrt,
+}
+
+
+def evaluate(opcode, *values):
+    """
+    :return: the result of opcode applied to values, None when it can not be computed at compile time
+    """
+    fn = EVALUATE.get(opcode)
+    if fn is None:
+        return None
+    try:
+        result = fn(*values)
+    except (ArithmeticError, ValueError):
+        return None
+    if result is None or not math.isfinite(result):
+        return None
+    return float(result)
+
+
+def format_immediate(value: float) -> str:
+    """Positional notation, the game does not read exponents such as 1e-05"""
+    if value.is_integer():
+        return str(int(value))
+    return format(Decimal(repr(value)), 'f')
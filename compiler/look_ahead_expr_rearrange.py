@@ -1,14 +1,99 @@
-from typing import Optional
-
 from lark import Tree
-from lark.lexer import Token
 
 from compiler.expr_look_ahead import ExprLookAhead
 
 
+def _combine(left, right):
+    # Sethi-Ullman: the operand needing more registers runs first and the other one reuses the rest,
+    # operands with the same need keep one register for the first result
+    return max(left, right) if left != right else left + 1
+
+
 class LAExprRearrange(ExprLookAhead):
+    """
+    Numbers expression trees with the temporary registers they need (Sethi-Ullman), immediates and
+    variables need none. InstBuilder evaluates the operand with the larger need first, so the registers
+    of the first result are the only ones held while the second operand runs.
+    """
+
+    def need(self, node) -> int:
+        """Temporary registers needed to evaluate node, cached on the node"""
+        if not isinstance(node, Tree):
+            return 0
+        need = getattr(node, 'need', None)
+        if need is None:
+            need = 0 if self.build_env.annotator.facts(node).is_const else self.visit(node)
+            node.need = need
+        return need
+
+    def right_first(self, left, right) -> bool:
+        return self.need(right) > self.need(left)
+
+    def _chain(self, operands):
+        needs = [self.need(operand) for operand in operands]
+        need = needs[0]
+        for other in needs[1:]:
+            need = _combine(need, other)
+        return need
+
+    def reduce_expr(self, tree):
+        # Operators between the operands are tokens
+        return self._chain(tree.children[::2])
+
+    def unary_operator(self, right):
+        return max(1, self.need(right))
+
+    def comparison(self, expr):
+        return self.reduce_expr(expr)
+
+    def atom_expr(self, expr):
+        return 1
+
+    def call(self, expr):
+        arguments = expr.children[1].children if len(expr.children) > 1 and isinstance(expr.children[1], Tree) else []
+        return max(1, self._chain(arguments)) if arguments else 1
+
+    def attr_get(self, expr):
+        return max(1, self.need(expr.children[1]))
+
+    def dot_access(self, expr):
+        return 1
+
+    def and_test(self, stmt):
+        return self._chain(stmt.children)
+
+    def or_test(self, stmt):
+        return self._chain(stmt.children)
+
+    def not_test(self, stmt):
+        return self.unary_operator(stmt.children[0])
+
+    def test(self, stmt):
+        return max(1, *(self.need(node) for node in stmt.children))
+
+    def var(self, var):
+        return 0
+
+    def const_true(self, token):
+        return 0
+
+    def const_false(self, token):
+        return 0
+
+    def loc(self, loc):
+        return 0
+
+    def factor(self, number):
+        return self.unary_operator(number.children[1])
+
+    def number(self, number):
+        return 0
+
+    def string(self, string):
+        return 0
+
+    def subscriptlist(self, expr):
+        return self.need(expr.children[0])
 
-    def __init__(self, id, node):
-        self.loc_used = []
-        self.tree = None
-        # TODO implement possible to save register use
+    def subscript(self, expr):
+        return self.need(expr.children[0])
@@ -0,0 +1,117 @@
+"""
+Loop invariant code motion over the virtual program: computations in a loop whose operands the loop never
+writes move in front of the loop head and run once instead of on every iteration.
+
+Device loads stay in the loop, the values can change across the yields of the loop.
+"""
+from collections import Counter
+
+from compiler.flow import successors, liveness
+from compiler.instruction import defs, uses
+from compiler.register_allocator import is_virtual
+from compiler.value_numbering import PURE
+
+HOISTABLE = PURE | {'move'}
+
+
+class Loop:
+    """Instructions head..tail, tail is the last instruction jumping back to head"""
+
+    def __init__(self, head, tail):
+        self.head = head
+        self.tail = tail
+
+    def __contains__(self, index):
+        return self.head <= index <= self.tail
+
+
+class LoopInvariants:
+    """
+    :param live_at_exit: registers observed when the program ends
+    """
+
+    def __init__(self, program, labels, fixups, live_at_exit=()):
+        self.program = list(program)
+        self.labels = dict(labels)
+        self.fixups = list(fixups)
+        self.live_at_exit = set(live_at_exit)
+        self.hits = Counter()
+
+    def loops(self, succ):
+        """Loops closed by backward edges, innermost first"""
+        tails = {}
+        for i, nxt in enumerate(succ):
+            for j in nxt:
+                if j <= i:
+                    tails[j] = max(i, tails.get(j, i))
+        return sorted((Loop(head, tail) for head, tail in tails.items()), key=lambda loop: loop.tail - loop.head)
+
+    def _single_entry(self, loop, succ):
+        """Structured loops are only entered through their head"""
+        return all(j not in loop or j == loop.head or i in loop for i, nxt in enumerate(succ) for j in nxt)
+
+    def _invariant(self, loop, i, written, live_in, succ):
+        inst = self.program[i]
+        if inst[0] not in HOISTABLE or len(defs(inst)) != 1:
+            return False
+        dst = defs(inst)[0]
+        if not is_virtual(dst) or written[dst] != 1 or dst in live_in[loop.head]:
+            # Also assigned elsewhere in the loop, or the value of the previous iteration is read
+            return False
+        if any(operand in written for operand in uses(inst)):
+            return False
+        # The loop may exit without running inst, it must not change a value read after the loop
+        n = len(self.program)
+        for k in range(loop.head, loop.tail + 1):
+            for j in succ[k]:
+                if j not in loop and dst in (self.live_at_exit if j >= n else live_in[j]):
+                    return False
+        return True
+
+    def _hoist(self, loop, indexes, succ):
+        """Move the instructions at indexes in front of the loop head"""
+        inside = {label for index, _, label in self.fixups if index in loop}
+        hoisted = [self.program[i] for i in indexes]
+        body = [inst for i, inst in enumerate(self.program[loop.head:loop.tail + 1], loop.head) if i not in indexes]
+        self.program[loop.head:loop.tail + 1] = hoisted + body
+
+        def position(index):
+            if index < loop.head or index > loop.tail:
+                return index
+            return loop.head + len(hoisted) + sum(1 for k in range(loop.head, index) if k not in indexes)
+
+        # Labels on the head reached from outside the loop lead into the hoisted code
+        self.labels = {label: index if index == loop.head and label not in inside else position(index)
+                       for label, index in self.labels.items()}
+        self.fixups = [(position(index), slot, label) for index, slot, label in self.fixups]
+
+    def run(self):
+        """
+        :return: (program, labels, fixups) with the invariant computations in front of their loops
+        """
+        changed = True
+        while changed:
+            changed = False
+            succ = successors(self.program, self.labels, self.fixups)
+            live_in, _ = liveness(self.program, succ, is_virtual, self.live_at_exit)
+            for loop in self.loops(succ):
+                if not self._single_entry(loop, succ):
+                    continue
+                written = Counter(register for inst in self.program[loop.head:loop.tail + 1] for register in defs(inst))
+                indexes = [i for i in range(loop.head, loop.tail + 1)
+                           if self._invariant(loop, i, written, live_in, succ)]
+                if indexes:
+                    self._hoist(loop, indexes, succ)
+                    self.hits['hoisted'] += len(indexes)
+                    changed = True
+                    # Indexes moved, analyse the program again
+                    break
+        return self.program, self.labels, self.fixups
+
+
+def hoist_invariants(program, labels, fixups, live_at_exit=()):
+    """
+    :return: (program, labels, fixups, hits)
+    """
+    motion = LoopInvariants(program, labels, fixups, live_at_exit)
+    return motion.run() + (motion.hits,)
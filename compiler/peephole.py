@@ -0,0 +1,153 @@
+"""
+Peephole optimizer, rewrites short windows of the instruction stream before the labels are resolved.
+
+Rules are registered with the peephole_rule decorator. A rule is called with the running pass and the
+index and instructions of its window, it returns the replacement instructions or None to leave the
+window alone. Windows never contain a branch target after their first instruction.
+"""
+from collections import Counter
+
+from compiler.flow import successors, liveness
+from compiler.instruction import defs, is_branch, branch_taken, label_slot, INVERSE_BRANCHES
+
+RULES = {}
+
+
+class PeepholeRule:
+    def __init__(self, name, size, fn):
+        self.name = name
+        self.size = size
+        self.fn = fn
+
+
+def peephole_rule(name, size=1):
+    """
+    Register a rule in RULES
+    :param size: number of instructions in the window
+    """
+    def register(fn):
+        RULES[name] = PeepholeRule(name, size, fn)
+        return fn
+    return register
+
+
+class Peephole:
+    """
+    :param rules: names of the rules to run, all registered rules by default
+    :param is_register: registers tracked by the liveness analysis
+    :param live_at_exit: registers observed when the program ends
+    """
+
+    def __init__(self, rules=None, is_register=None, live_at_exit=()):
+        self.rules = [RULES[name] for name in (rules if rules is not None else RULES)]
+        self.is_register = is_register or (lambda operand: False)
+        self.live_at_exit = live_at_exit
+        self.hits = Counter()
+        self.program = []
+        self.labels = {}
+        self._live_out = None
+
+    def fixups(self):
+        """The fixups of the current program, every branch keeps its label operand until resolve_labels"""
+        return [(i, label_slot(inst), inst[label_slot(inst)]) for i, inst in enumerate(self.program) if is_branch(inst)]
+
+    def targets(self):
+        """Indexes some branch jumps to, labels nothing refers to any more do not split windows"""
+        return {self.labels[label] for _, _, label in self.fixups()}
+
+    def target(self, inst):
+        """Index of the label a branch jumps to"""
+        return self.labels[inst[label_slot(inst)]]
+
+    def live_out(self, index):
+        if self._live_out is None:
+            succ = successors(self.program, self.labels, self.fixups())
+            _, self._live_out = liveness(self.program, succ, self.is_register, self.live_at_exit)
+        return self._live_out[index]
+
+    def run(self, program, labels):
+        """
+        :return: (program, labels) after applying the rules until none of them matches
+        """
+        self.program = list(program)
+        self.labels = dict(labels)
+        changed = True
+        while changed:
+            changed = False
+            targets = self.targets()
+            i = 0
+            while i < len(self.program):
+                for rule in self.rules:
+                    end = i + rule.size
+                    if end > len(self.program) or any(t in targets for t in range(i + 1, end)):
+                        continue
+                    replacement = rule.fn(self, i, self.program[i:end])
+                    if replacement is not None:
+                        self._replace(i, end, replacement)
+                        self.hits[rule.name] += 1
+                        targets = self.targets()
+                        changed = True
+                        break
+                i += 1
+        return self.program, self.labels
+
+    def _replace(self, start, end, replacement):
+        removed = (end - start) - len(replacement)
+        self.program[start:end] = replacement
+        # Only the start of the window can be a label target, labels after it move with the code
+        self.labels = {label: index if index <= start else index - removed for label, index in self.labels.items()}
+        self._live_out = None
+
+
+@peephole_rule('self_move')
+def self_move(peephole, i, window):
+    """move r0 r0"""
+    inst, = window
+    if inst[0] == 'move' and inst[1] == inst[2]:
+        return []
+
+
+@peephole_rule('constant_branch')
+def constant_branch(peephole, i, window):
+    """beq 1 0 L never jumps, beq 0 0 L always does"""
+    inst, = window
+    taken = branch_taken(inst)
+    if taken is False:
+        return []
+    if taken:
+        return [('j', inst[label_slot(inst)])]
+
+
+@peephole_rule('unreachable', size=2)
+def unreachable(peephole, i, window):
+    """Code after j that no label points to, aliases are kept for the device names they show in game"""
+    jump, inst = window
+    if jump[0] == 'j' and inst[0] != 'alias':
+        return [jump]
+
+
+@peephole_rule('jump_to_next')
+def jump_to_next(peephole, i, window):
+    """j L where L is the next line"""
+    inst, = window
+    if is_branch(inst) and peephole.target(inst) == i + 1:
+        return []
+
+
+@peephole_rule('branch_over_jump', size=2)
+def branch_over_jump(peephole, i, window):
+    """beq a b L1; j L2; L1: becomes bne a b L2"""
+    branch, jump = window
+    if branch[0] in INVERSE_BRANCHES and jump[0] == 'j' and peephole.target(branch) == i + 2:
+        return [(INVERSE_BRANCHES[branch[0]],) + branch[1:-1] + (jump[1],)]
+
+
+@peephole_rule('forward_move', size=2)
+def forward_move(peephole, i, window):
+    """add r1 r2 r3; move r4 r1 becomes add r4 r2 r3 when r1 is not read afterwards"""
+    inst, move = window
+    if move[0] != 'move' or defs(inst) != [move[2]] or not peephole.is_register(move[2]):
+        return None
+    if move[2] in peephole.live_out(i + 1):
+        return None
+    return [(inst[0], move[1]) + inst[2:]]
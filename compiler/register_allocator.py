@@ -0,0 +1,195 @@
+import re
+from itertools import count
+
+from compiler.exceptions import MipsCodeError
+from compiler.flow import successors, liveness, loop_depth
+from compiler.instruction import defs, uses, rename
+
+REGISTER_COUNT = 16
+PHYSICAL_REGISTERS = {f'r{k}' for k in range(REGISTER_COUNT)}
+
+# Virtual registers created by InstBuilder, v<n> for variables and t<n>.<scope> for temporaries,
+# s<n> holds a spilled value between its reload from the stack and its use
+_VIRTUAL = re.compile(r'[vts]\d+(\.\d+)?$')
+
+# Spilling a value costs LOOP_WEIGHT ** depth for every instruction that uses or defines it
+LOOP_WEIGHT = 10
+
+
+def is_virtual(operand) -> bool:
+    return isinstance(operand, str) and _VIRTUAL.match(operand) is not None
+
+
+def is_physical(operand) -> bool:
+    return operand in PHYSICAL_REGISTERS
+
+
+def is_temporary(operand) -> bool:
+    return operand[0] in 'ts'
+
+
+def is_reload(operand) -> bool:
+    return operand.startswith('s')
+
+
+class RegisterAllocator:
+    """
+    Maps the virtual registers used by InstBuilder onto r0-r15.
+
+    A liveness analysis of the program gives the interference graph, which is colored greedily.
+    Variables are colored first in declaration order. A variable or temporary gives its register to
+    others after its last use, only values read again when the script starts over stay live at the end.
+
+    When 16 registers are not enough the cheapest value is moved to its own stack slot: it is
+    stored with 'move sp K; push x' after every definition and reloaded with 'move sp K+1; peek x'
+    before every use. Allocation then starts over on the rewritten program.
+    """
+
+    def __init__(self, program, labels, fixups, variables):
+        self.program = list(program)
+        self.labels = dict(labels)
+        self.fixups = list(fixups)
+        self.variables = [variable for variable in variables if is_virtual(variable)]
+        # virtual register -> stack slot
+        self.spilled = {}
+        self.mapping = {}
+        self._reloads = 0
+
+    def _node(self, register):
+        if register not in self.graph:
+            self.graph[register] = set()
+            self.moves[register] = set()
+
+    def _interfere(self, a, b):
+        if a != b:
+            self.graph[a].add(b)
+            self.graph[b].add(a)
+
+    def _liveness(self, succ):
+        """
+        Nothing is read after the end, unless the chip runs the script again from the first line,
+        the values live at the start are live at the end as well.
+        """
+        live_at_exit = set()
+        while True:
+            live_in, live_out = liveness(self.program, succ, is_virtual, live_at_exit)
+            entry = live_in[0] if self.program else set()
+            if entry <= live_at_exit:
+                return live_in, live_out
+            live_at_exit |= entry
+
+    def build(self):
+        self.graph = {}
+        self.moves = {}
+        succ = successors(self.program, self.labels, self.fixups)
+        self.depth = loop_depth(succ)
+        variables = [variable for variable in self.variables if variable not in self.spilled]
+        live_in, live_out = self._liveness(succ)
+
+        for variable in variables:
+            self._node(variable)
+        for inst in self.program:
+            for register in defs(inst) + uses(inst):
+                if is_virtual(register):
+                    self._node(register)
+
+        for i, inst in enumerate(self.program):
+            # The source of a move may share the register of its destination
+            source = inst[2] if inst[0] == 'move' else None
+            for register in defs(inst):
+                if not is_virtual(register):
+                    continue
+                for live in live_out[i]:
+                    if live != source:
+                        self._interfere(register, live)
+            if source is not None and is_virtual(inst[1]) and is_virtual(source) \
+                    and (is_temporary(inst[1]) or is_temporary(source)):
+                self.moves[inst[1]].add(source)
+                self.moves[source].add(inst[1])
+
+        # Registers read before they are written are all live together when the program starts
+        if self.program:
+            entry = sorted(live_in[0])
+            for i, a in enumerate(entry):
+                for b in entry[i + 1:]:
+                    self._interfere(a, b)
+
+    def color(self):
+        """
+        :return: (virtual register -> color, None) or (partial coloring, the register that did not fit)
+        """
+        order = [variable for variable in self.variables if variable in self.graph]
+        order += [register for register in self.graph if register not in order]
+        colors = {}
+        for register in order:
+            used = {colors[n] for n in self.graph[register] if n in colors}
+            preferred = [colors[m] for m in self.moves[register] if m in colors and colors[m] not in used]
+            color = preferred[0] if preferred else next(c for c in count() if c not in used)
+            if color >= REGISTER_COUNT:
+                return colors, register
+            colors[register] = color
+        return colors, None
+
+    def spill_cost(self, register) -> float:
+        """Instructions added by spilling register, weighted by loop depth, per interference removed"""
+        cost = sum(LOOP_WEIGHT ** self.depth[i] for i, inst in enumerate(self.program)
+                   if register in defs(inst) or register in uses(inst))
+        return cost / (len(self.graph[register]) + 1)
+
+    def choose_spill(self, register, colors):
+        """Pick the cheapest value among register and the neighbours that took the colors it needed"""
+        candidates = [n for n in [register, *self.graph[register]] if n in colors or n == register]
+        candidates = [n for n in candidates if not is_reload(n)]
+        if not candidates:
+            raise MipsCodeError(f'Not enough registers, {register} needs r{REGISTER_COUNT}')
+        return min(candidates, key=self.spill_cost)
+
+    def spill(self, register):
+        slot = len(self.spilled)
+        self.spilled[register] = slot
+        program = []
+        # Old index -> index of its first instruction and of the instruction itself
+        starts, positions = [], []
+        for inst in self.program:
+            starts.append(len(program))
+            used, defined = register in uses(inst), register in defs(inst)
+            if used or defined:
+                reload = f's{self._reloads}'
+                self._reloads += 1
+                if used:
+                    program += [('move', 'sp', str(slot + 1)), ('peek', reload)]
+                positions.append(len(program))
+                program.append(rename(inst, {register: reload}))
+                if defined:
+                    program += [('move', 'sp', str(slot)), ('push', reload)]
+            else:
+                positions.append(len(program))
+                program.append(inst)
+        starts.append(len(program))
+
+        self.program = program
+        self.labels = {label: starts[index] for label, index in self.labels.items()}
+        self.fixups = [(positions[index], slot_, label) for index, slot_, label in self.fixups]
+
+    def allocate(self):
+        """
+        :return: (program using r0-r15, virtual register -> physical register)
+        """
+        while True:
+            self.build()
+            colors, failed = self.color()
+            if failed is None:
+                break
+            self.spill(self.choose_spill(failed, colors))
+        self.mapping = {register: f'r{color}' for register, color in colors.items()}
+        return [rename(inst, self.mapping) for inst in self.program], self.mapping
+
+    def location(self, register) -> str:
+        """Where the value of a virtual register ends up, for debug output"""
+        if register in self.spilled:
+            return f'stack[{self.spilled[register]}]'
+        return self.mapping.get(register, register)
+
+    def variable_registers(self):
+        """Physical registers holding a variable when the program ends"""
+        return [self.mapping[variable] for variable in self.variables if variable in self.mapping]
@@ -0,0 +1,246 @@
+from lark import Tree
+
+from compiler.Visitor import CompileEnv
+from compiler.instruction import OPERATOR_OPCODES, BRANCH_OPCODES, evaluate
+from compiler.types import Device, VarType, FunctionBuiltIn
+
+
+class NodeFacts:
+    """
+    Facts about an expression node, computed once before code generation.
+
+    :param is_const: the node evaluates to an immediate and needs no register
+    :param can_assign: the node can write its result directly into a destination register
+    :param can_branch: the node can be lowered to a conditional branch
+    :param return_type: Device, VarType or None when unknown
+    :param value: the value of the node when it is known at compile time
+    """
+    __slots__ = ('is_const', 'can_assign', 'can_branch', 'return_type', 'value')
+
+    def __init__(self, is_const=False, can_assign=False, can_branch=False, return_type=None, value=None):
+        self.is_const = is_const
+        self.can_assign = can_assign
+        self.can_branch = can_branch
+        self.return_type = return_type
+        self.value = value
+
+
+def literal_value(text):
+    """Value of a number literal, None for the ones IC10 has no immediate for"""
+    try:
+        return float(int(text, 0))
+    except ValueError:
+        pass
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+def folded(value) -> NodeFacts:
+    """Facts of a node that InstBuilder replaces by the immediate value"""
+    return NodeFacts(is_const=True, return_type=VarType, value=value)
+
+
+class SemanticAnnotator(CompileEnv):
+    """
+    Walks the tree once in program order and attaches NodeFacts to every expression
+    node, children before parents, so InstBuilder can read them in O(1).
+    """
+
+    def __init__(self, build_env):
+        super().__init__(build_env)
+        self.devices = set(build_env.device_table)
+
+    def facts(self, node) -> NodeFacts:
+        """Facts for node, annotating it first if it was created after the pass (e.g. by InstBuilder)"""
+        facts = getattr(node, 'facts', None)
+        if facts is None:
+            facts = self.annotate(node)
+        return facts
+
+    def annotate(self, node) -> NodeFacts:
+        facts = self.visit(node)
+        node.facts = facts
+        return facts
+
+    def _children(self, node):
+        for child in node.children:
+            if isinstance(child, Tree):
+                self.facts(child)
+
+    # Statements
+    def root(self, stmts):
+        self._children(stmts)
+
+    def stmt(self, stmt):
+        self._children(stmt)
+
+    def suite(self, stmt):
+        self._children(stmt)
+
+    def compound_stmt(self, stmt):
+        self._children(stmt)
+
+    def if_stmt(self, stmt):
+        self._children(stmt)
+
+    def while_stmt(self, stmt):
+        self._children(stmt)
+
+    def yield_stmt(self, stmt):
+        pass
+
+    def augassign(self, stmt):
+        pass
+
+    def assignment_stmt(self, stmt):
+        self._children(stmt)
+        target = stmt.children[0]
+        op = stmt.children[1].children[0]
+        if op.value == '=' and target.data == 'var':
+            if self.facts(stmt.children[2]).return_type is Device:
+                self.devices.add(target.children[0].value)
+
+    # Expressions
+    def _value(self, node):
+        return self.facts(node).value if isinstance(node, Tree) else None
+
+    def _fold(self, operands, opcodes):
+        """Evaluate operands[0] opcodes[0] operands[1] ... left to right, as InstBuilder.reduce_expr does"""
+        values = [self._value(operand) for operand in operands]
+        if None in values:
+            return None
+        result = values[0]
+        for opcode, value in zip(opcodes, values[1:]):
+            result = evaluate(opcode, result, value)
+            if result is None:
+                return None
+        return result
+
+    def _reduce_expr(self, tree, **kwargs):
+        self._children(tree)
+        value = self._fold(tree.children[::2], [OPERATOR_OPCODES.get(op.value) for op in tree.children[1::2]])
+        if value is not None:
+            return folded(value)
+        return NodeFacts(can_assign=True, **kwargs)
+
+    def _reduce_logic(self, tree, opcode):
+        self._children(tree)
+        value = self._fold(tree.children, [opcode] * (len(tree.children) - 1))
+        if value is not None:
+            return folded(value)
+        return NodeFacts(can_assign=True)
+
+    def expr(self, expr):
+        return self._reduce_expr(expr)
+
+    def term(self, expr):
+        return self._reduce_expr(expr)
+
+    def arith_expr(self, expr):
+        return self._reduce_expr(expr)
+
+    def comparison(self, expr):
+        # A single comparison becomes a compare and branch instruction, chains are evaluated left to right
+        return self._reduce_expr(expr, can_branch=len(expr.children) == 3 and expr.children[1] in BRANCH_OPCODES)
+
+    def and_test(self, stmt):
+        return self._reduce_logic(stmt, 'and')
+
+    def or_test(self, stmt):
+        return self._reduce_logic(stmt, 'or')
+
+    def not_test(self, stmt):
+        self._children(stmt)
+        value = self._fold([stmt.children[0], Tree('number', ['1'])], ['xor'])
+        if value is not None:
+            return folded(value)
+        return NodeFacts(can_assign=True)
+
+    def test(self, stmt):
+        self._children(stmt)
+        # a if condition else b
+        condition = self._value(stmt.children[1])
+        if condition is not None:
+            value = self._value(stmt.children[0] if condition else stmt.children[2])
+            if value is not None:
+                return folded(value)
+        return NodeFacts(can_assign=True)
+
+    def attr_get(self, expr):
+        self._children(expr)
+        return NodeFacts(can_assign=True)
+
+    def dot_access(self, expr):
+        self._children(expr)
+        return NodeFacts(can_assign=True)
+
+    def call(self, expr):
+        self._children(expr)
+        callee = expr.children[0]
+        if not isinstance(callee, Tree) or callee.data != 'var':
+            return NodeFacts()
+        function = self.build_env.vtable.get(callee.children[0].value)
+        if isinstance(function, FunctionBuiltIn):
+            arguments = expr.children[1].children if len(expr.children) > 1 else []
+            # Everything but rand and sleep is pure
+            if function.returns and function.no_args and len(arguments) == function.no_args:
+                values = [self._value(argument) for argument in arguments]
+                if None not in values:
+                    value = evaluate(function.inst, *values)
+                    if value is not None:
+                        return folded(value)
+            return NodeFacts(can_assign=function.returns, return_type=VarType)
+        if function is not None:
+            return NodeFacts(return_type=type(function.var_type))
+        # Unknown function, InstBuilder.call reports it
+        return NodeFacts()
+
+    def arguments(self, expr):
+        self._children(expr)
+        return NodeFacts()
+
+    def atom_expr(self, expr):
+        self._children(expr)
+        return NodeFacts()
+
+    def factor(self, number):
+        self._children(number)
+        value = self._value(number.children[1])
+        if number.children[0].value != '-':
+            return NodeFacts(can_assign=True)
+        if number.children[1].data == 'number':
+            # Negative literal, used as an immediate
+            return NodeFacts(is_const=True, return_type=VarType, value=None if value is None else -value)
+        if value is not None:
+            return folded(-value)
+        return NodeFacts(can_assign=True)
+
+    def var(self, var):
+        if var.children[0].value in self.devices:
+            return NodeFacts(return_type=Device)
+        return NodeFacts()
+
+    def string(self, string):
+        return NodeFacts()
+
+    def const_true(self, token):
+        return NodeFacts(is_const=True, value=1.0)
+
+    def const_false(self, token):
+        return NodeFacts(is_const=True, value=0.0)
+
+    def loc(self, loc):
+        return NodeFacts(is_const=True, can_assign=True, return_type=VarType)
+
+    def number(self, number):
+        return NodeFacts(is_const=True, return_type=VarType, value=literal_value(number.children[0]))
+
+    def subscriptlist(self, expr):
+        self._children(expr)
+        return self.facts(expr.children[0])
+
+    def subscript(self, expr):
+        self._children(expr)
+        return self.facts(expr.children[0])
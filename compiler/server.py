@@ -0,0 +1,74 @@
+import json
+import os
+import socketserver
+import sys
+from contextlib import redirect_stdout
+from pathlib import Path
+
+from compiler.compiler import get_parser, _compile_file, _compile_src
+
+
+def handle_request(request: dict) -> dict:
+    """
+    Compile one request, either {"src": "...", "debug": false} or {"file": "script.py", "debug": false}.
+    "rotate_loops": true turns on the loop rotation of Compiler.
+    A file request also writes <file>.mips like compile_file.
+    :return: {"output": str, "error": str or None}
+    """
+    debug = bool(request.get('debug', False))
+    rotate_loops = bool(request.get('rotate_loops', False))
+    try:
+        # stdout may be the response channel, keep the compiler's debug prints off it
+        with redirect_stdout(sys.stderr):
+            if 'file' in request:
+                result = _compile_file(Path(request['file']), debug, rotate_loops=rotate_loops)
+                return {'output': result.output, 'error': result.error}
+            output = _compile_src(request['src'], debug, rotate_loops)
+        return {'output': output, 'error': None}
+    except Exception as exc:
+        return {'output': str(exc), 'error': str(exc)}
+
+
+def _handle_line(line: str) -> str:
+    try:
+        request = json.loads(line)
+    except ValueError as exc:
+        response = {'output': '', 'error': f'invalid request: {exc}'}
+    else:
+        response = handle_request(request)
+    return json.dumps(response) + '\n'
+
+
+def serve_stdio(fd_in, fd_out):
+    """Answer one JSON request per line from fd_in until it is closed"""
+    get_parser()
+    for line in fd_in:
+        if not line.strip():
+            continue
+        fd_out.write(_handle_line(line))
+        fd_out.flush()
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            self.wfile.write(_handle_line(line.decode('utf8')).encode('utf8'))
+            self.wfile.flush()
+
+
+def serve_unix(path):
+    """
+    Answer JSON line requests on a unix socket until interrupted.
+    Requests are handled one at a time as the parser is shared.
+    """
+    get_parser()
+    if os.path.exists(path):
+        os.unlink(path)
+    with socketserver.UnixStreamServer(path, _RequestHandler) as server:
+        try:
+            server.serve_forever()
+        finally:
+            os.unlink(path)
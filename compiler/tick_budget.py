@@ -0,0 +1,100 @@
+"""
+Static tick budget analysis of the compiled program.
+
+The game runs at most TICK_BUDGET instructions per tick, a yield or sleep ends the tick early. A segment is
+the code from the program start or a yield/sleep to the next yield/sleep or the program end, the analysis
+finds the longest path through every segment. A segment longer than the budget spreads over several ticks
+and its outputs lag. The analysis can not count the iterations of a loop without yield or sleep, such a
+segment is reported unbounded with the budget as its count, the game stops it there and resumes on the next tick.
+"""
+from compiler.flow import successors
+
+TICK_BUDGET = 128
+# Instructions ending the tick, each runs as one line of the tick it ends
+TICK_ENDS = {'yield', 'sleep'}
+UNBOUNDED = float('inf')
+
+
+class TickBudget:
+    """
+    :param budget: instructions the game runs per tick
+    """
+
+    def __init__(self, program, labels, fixups, budget=TICK_BUDGET):
+        self.program = program
+        self.budget = budget
+        self.succ = successors(program, labels, fixups)
+        # Longest path from every instruction to the end of its segment, and its next instruction
+        self._longest = {}
+        self._next = {}
+
+    def starts(self):
+        """Indexes a tick can start at"""
+        return [0] + [i + 1 for i, inst in enumerate(self.program) if inst[0] in TICK_ENDS and i + 1 < len(self.program)]
+
+    def longest(self, i, visiting=None):
+        """
+        :return: the instructions run from i to the end of its segment on the longest path, UNBOUNDED for a loop
+                 without yield or sleep
+        """
+        if i >= len(self.program):
+            return 0
+        if i in self._longest:
+            return self._longest[i]
+        op = self.program[i][0]
+        if op in TICK_ENDS:
+            self._longest[i] = 1
+            return 1
+        visiting = visiting if visiting is not None else set()
+        if i in visiting:
+            return UNBOUNDED
+        visiting.add(i)
+        best, best_next = 0, None
+        for j in self.succ[i]:
+            cost = self.longest(j, visiting)
+            if best_next is None or cost > best:
+                best, best_next = cost, j
+        visiting.discard(i)
+        self._longest[i] = 1 + best
+        self._next[i] = best_next
+        return self._longest[i]
+
+    def path(self, start):
+        """Instructions on the longest path of the segment at start, a loop ends at its first repeated instruction"""
+        path = []
+        i = start
+        while i is not None and i < len(self.program) and i not in path:
+            path.append(i)
+            i = self._next.get(i)
+        if i is not None and i in path:
+            path.append(i)
+        return path
+
+    def segments(self):
+        """
+        :return: a dict per segment with its start, end (None for the program end or a loop), worst case
+                 instruction count (the budget when unbounded), status ('ok', 'overflow' or 'unbounded')
+                 and longest path
+        """
+        segments = []
+        for start in self.starts():
+            count = self.longest(start)
+            path = self.path(start)
+            last = path[-1] if path else None
+            if count == UNBOUNDED:
+                status, count, end = 'unbounded', self.budget, None
+            else:
+                status = 'overflow' if count > self.budget else 'ok'
+                end = last if last is not None and self.program[last][0] in TICK_ENDS else None
+            segments.append({'start': start, 'end': end, 'instructions': count, 'status': status, 'path': path})
+        return segments
+
+    def report(self):
+        """ok is False when a segment overflows, an unbounded loop may well end within the budget"""
+        segments = self.segments()
+        return {
+            'budget': self.budget,
+            'program_length': len(self.program),
+            'ok': all(segment['status'] != 'overflow' for segment in segments),
+            'segments': segments,
+        }
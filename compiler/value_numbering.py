@@ -0,0 +1,124 @@
+"""
+Global value numbering over the virtual program: an instruction computing a value that a register
+already holds becomes a move from that register.
+
+Device loads stay available until the next yield or sleep, a store to the same device or the head of
+a loop, where the tick may end because the instruction budget runs out.
+"""
+from collections import Counter
+
+from compiler.flow import successors, predecessors
+from compiler.instruction import defs, EVALUATE, OPERANDS
+
+LOADS = {'l', 'lr', 'ls'}
+# Instructions whose result only depends on their operands
+PURE = set(EVALUATE) | {'select'}
+COMMUTATIVE = {'add', 'mul', 'and', 'or', 'xor', 'seq', 'sne', 'min', 'max'}
+# Time passes, devices may have new values
+TICK_OPS = {'yield', 'sleep'}
+
+
+def value_key(inst):
+    """
+    The value computed by inst, its opcode and source operands, None when it can not be reused
+    """
+    op = inst[0]
+    if op not in PURE and op not in LOADS:
+        return None
+    if OPERANDS.get(op, '')[:1] != 'w' or inst[1] in inst[2:]:
+        # No result, or it overwrites one of its own operands
+        return None
+    sources = inst[2:]
+    if op in COMMUTATIVE:
+        sources = tuple(sorted(sources))
+    return (op,) + tuple(sources)
+
+
+def _is_load(key):
+    return key[0] in LOADS
+
+
+class ValueNumbering:
+    """
+    Forward available values analysis, an available value is a (key, register) pair that holds on
+    every path reaching the instruction.
+    """
+
+    def __init__(self, program, labels, fixups):
+        self.program = program
+        self.succ = successors(program, labels, fixups)
+        self.pred = predecessors(self.succ)
+        self.hits = Counter()
+        # Loop heads, the targets of backward edges
+        self.loop_heads = {j for i, nxt in enumerate(self.succ) for j in nxt if j <= i}
+
+    def _transfer(self, i, available):
+        inst = self.program[i]
+        op = inst[0]
+        if op in TICK_OPS:
+            available = {pair for pair in available if not _is_load(pair[0])}
+        elif op == 's':
+            device = inst[1]
+            available = {pair for pair in available if not (_is_load(pair[0]) and pair[0][1] == device)}
+        for register in defs(inst):
+            available = {(key, holder) for key, holder in available if holder != register and register not in key}
+        key = value_key(inst)
+        if key is not None:
+            available = available | {(key, inst[1])}
+        return available
+
+    def _entry(self, i, available_out):
+        preds = self.pred[i]
+        if i == 0 or not preds:
+            return set()
+        reaching = [available_out[p] for p in preds if available_out[p] is not None]
+        if not reaching:
+            return None
+        available = set.intersection(*reaching)
+        if i in self.loop_heads:
+            available = {pair for pair in available if not _is_load(pair[0])}
+        return available
+
+    def analyse(self):
+        """
+        :return: the available values on entry of every instruction
+        """
+        n = len(self.program)
+        # None is the top of the lattice, nothing computed yet
+        available_in = [None] * n
+        available_out = [None] * n
+        changed = True
+        while changed:
+            changed = False
+            for i in range(n):
+                entry = self._entry(i, available_out)
+                if entry is None:
+                    continue
+                out = self._transfer(i, entry)
+                if entry != available_in[i] or out != available_out[i]:
+                    available_in[i], available_out[i] = entry, out
+                    changed = True
+        return [entry or set() for entry in available_in]
+
+    def run(self):
+        """
+        :return: the program with recomputed values replaced by moves
+        """
+        available_in = self.analyse()
+        program = []
+        for i, inst in enumerate(self.program):
+            key = value_key(inst)
+            holders = sorted(holder for k, holder in available_in[i] if k == key and holder != inst[1])
+            if key is not None and holders:
+                self.hits['load' if _is_load(key) else 'expression'] += 1
+                inst = ('move', inst[1], holders[0])
+            program.append(inst)
+        return program
+
+
+def number_values(program, labels, fixups):
+    """
+    :return: (program, hits per kind of reused value)
+    """
+    numbering = ValueNumbering(program, labels, fixups)
+    return numbering.run(), numbering.hits
@@ -0,0 +1,63 @@
+import hashlib
+import sys
+import time
+from pathlib import Path
+
+from compiler.build_cache import BuildCache
+from compiler.compiler import get_parser, _compile_file
+
+
+class Watcher:
+    """
+    Recompiles the scripts of a folder whose content changed since the last poll.
+    The modification time is checked first, the content hash only when it moved.
+    """
+
+    def __init__(self, directory: Path, debug=False, cache: BuildCache = None, rotate_loops=False):
+        self.directory = Path(directory)
+        self.debug = debug
+        self.cache = cache
+        self.rotate_loops = rotate_loops
+        # file -> (mtime_ns, size, sha256 of the content)
+        self._seen = {}
+
+    def changed_files(self):
+        changed = []
+        present = set()
+        for file in sorted(self.directory.glob('*.py')):
+            present.add(file)
+            try:
+                stat = file.stat()
+            except OSError:
+                continue
+            seen = self._seen.get(file)
+            if seen and seen[:2] == (stat.st_mtime_ns, stat.st_size):
+                continue
+            digest = hashlib.sha256(file.read_bytes()).hexdigest()
+            self._seen[file] = (stat.st_mtime_ns, stat.st_size, digest)
+            if seen and seen[2] == digest:
+                continue
+            changed.append(file)
+        for file in set(self._seen) - present:
+            del self._seen[file]
+        return changed
+
+    def poll(self):
+        """
+        :return: (CompileResult, seconds) for every recompiled file
+        """
+        results = []
+        for file in self.changed_files():
+            start = time.perf_counter()
+            result = _compile_file(file, self.debug, self.cache, self.rotate_loops)
+            results.append((result, time.perf_counter() - start))
+        return results
+
+    def run(self, interval=0.5, out=sys.stdout):
+        get_parser()
+        while True:
+            for result, seconds in self.poll():
+                status = f'error: {result.error}' if result.error else 'ok'
+                cached = ' (cached)' if result.cached else ''
+                print(f'{result.file.name}: {seconds * 1000:.1f} ms{cached} {status}', file=out, flush=True)
+            time.sleep(interval)
@@ -1,3 +1,4 @@
+import json
 import os
 import select
 import sys
@@ -11,7 +12,6 @@ if sys.version_info < MIN_PYTHON:
 import argparse
 
 from pathlib import Path
-from compiler.compiler import compile_file, compile_src
 
 if __name__ == "__main__":
 
@@ -20,20 +20,98 @@ if __name__ == "__main__":
                         help='folder or file for scripts', required=False)
     parser.add_argument('--debug', dest='debug', default=False,
                         help='Output additional debug information for the code', action='store_true')
+    parser.add_argument('-j', '--jobs', dest='jobs', default=1, type=int,
+                        help='Number of processes used to compile a folder, 0 uses all cores')
+    parser.add_argument('--cache-dir', dest='cache_dir', default=None,
+                        help='Build cache folder, defaults to .mips_cache next to the scripts')
+    parser.add_argument('--no-cache', dest='no_cache', default=False,
+                        help='Always recompile, ignoring the build cache', action='store_true')
+    parser.add_argument('--serve', dest='serve', nargs='?', const='-', default=None, metavar='SOCKET',
+                        help='Keep a warm compiler and answer JSON line requests on SOCKET, or stdin/stdout')
+    parser.add_argument('--connect', dest='connect', default=None, metavar='SOCKET',
+                        help='Forward the compile request to a server started with --serve SOCKET')
+    parser.add_argument('--watch', dest='watch', default=None, metavar='DIR',
+                        help='Keep the compiler resident and recompile scripts in DIR when they change')
+    parser.add_argument('--interval', dest='interval', default=0.5, type=float,
+                        help='Seconds between two polls in --watch mode')
+    parser.add_argument('--rotate-loops', dest='rotate_loops', default=False,
+                        help='Test while conditions at the bottom of the loop, one branch less per iteration '
+                             'for a longer program', action='store_true')
+    parser.add_argument('--tick-report', dest='tick_report', default=False,
+                        help='Print the worst case instructions between yields of one script as JSON', action='store_true')
     args = parser.parse_args()
-    if not sys.stdin.isatty() and not os.name == 'nt':
-        # TODO fix stdin for windows
-        src = sys.stdin.read()
-        print(compile_src(src, args.debug))
+
+    if args.connect:
+        # The client does not import the compiler, the server already has it loaded
+        from compiler.client import request
+        if args.input:
+            payload = {'file': str(Path(args.input).resolve()), 'debug': args.debug}
+        else:
+            payload = {'src': sys.stdin.read(), 'debug': args.debug}
+        payload['rotate_loops'] = args.rotate_loops
+        response = request(args.connect, payload)
+        print(response['output'])
+        sys.exit(1 if response['error'] else 0)
+
+    from compiler.build_cache import BuildCache, format_stats
+    from compiler.compiler import compile_file, compile_files, compile_src
+
+    if args.tick_report:
+        from compiler.compiler import Compiler
+        if args.input and Path(args.input).is_dir():
+            parser.error('--tick-report takes one script, not a folder')
+        src = Path(args.input).read_text() if args.input else sys.stdin.read()
+        compiler = Compiler(rotate_loops=args.rotate_loops)
+        try:
+            compiler.compile(src)
+        except Exception as exc:
+            print(json.dumps({'ok': False, 'error': str(exc)}, indent=2))
+            sys.exit(1)
+        report = compiler.tick_report()
+        print(json.dumps(report, indent=2))
+        sys.exit(0 if report['ok'] else 1)
+    elif args.watch:
+        from compiler.watch import Watcher
+        watch_dir = Path(args.watch)
+        cache = None if args.no_cache else BuildCache(args.cache_dir or watch_dir / '.mips_cache')
+        try:
+            Watcher(watch_dir, args.debug, cache, args.rotate_loops).run(args.interval)
+        except KeyboardInterrupt:
+            pass
+    elif args.serve == '-':
+        from compiler.server import serve_stdio
+        serve_stdio(sys.stdin, sys.stdout)
+    elif args.serve:
+        from compiler.server import serve_unix
+        serve_unix(args.serve)
     elif args.input:
         a = Path(args.input)
+        cache = None
+        if not args.no_cache:
+            cache = BuildCache(args.cache_dir or (a if Path.is_dir(a) else a.parent) / '.mips_cache')
 
         if Path.is_dir(a):
-            for child in a.iterdir():
-                if child.suffix == '.py':
-                    compile_file(child, args.debug)
+            files = sorted(child for child in a.iterdir() if child.suffix == '.py')
+            results = compile_files(files, args.debug, jobs=args.jobs or os.cpu_count(), cache=cache,
+                                    rotate_loops=args.rotate_loops)
+            for result in results:
+                print(result.output)
+            if cache:
+                print(format_stats(results), file=sys.stderr)
+            failed = [result for result in results if result.error]
+            for result in failed:
+                print(f'{result.file}: {result.error}', file=sys.stderr)
+            if failed:
+                print(f'{len(failed)} of {len(results)} files failed', file=sys.stderr)
+                sys.exit(1)
         elif a.suffix == '.py':
-            compile_file(a, args.debug)
+            result = compile_file(a, args.debug, cache=cache, rotate_loops=args.rotate_loops)
+            if cache:
+                print(format_stats([result]), file=sys.stderr)
+    elif not sys.stdin.isatty() and not os.name == 'nt':
+        # TODO fix stdin for windows
+        src = sys.stdin.read()
+        print(compile_src(src, args.debug, args.rotate_loops))
     else:
         print("Nothing on stdin and no --input given")
         sys.exit(1)
\ No newline at end of file
@@ -1,20 +1,151 @@
 import math
+import operator
 import traceback
 
 from compiler.compiler import Compiler
+from compiler.tick_budget import TICK_ENDS
+
+# Register file layout, r0-r15 followed by the special registers
+REGISTERS = {**{f'r{k}': k for k in range(16)}, 'sp': 16, 'ra': 17, 'o': 18}
+
+# Stack slots of an IC housing
+STACK_SIZE = 512
+SP = REGISTERS['sp']
+
+# Returned by an instruction to end the tick
+YIELD = -1
+# Returned by the sentinel after the last instruction
+HALT = -2
+
+BINARY_OPS = {
+    'and': lambda a, b: a and b,
+    'or': lambda a, b: a or b,
+    'xor': lambda a, b: float(bool(a) != bool(b)),
+    'add': operator.add,
+    'sub': operator.sub,
+    'mul': operator.mul,
+    'div': operator.truediv,
+    'mod': operator.mod,
+    'slt': lambda a, b: 1.0 if a < b else 0.0,
+    'sgt': lambda a, b: 1.0 if a > b else 0.0,
+    'sle': lambda a, b: 1.0 if a <= b else 0.0,
+    'sge': lambda a, b: 1.0 if a >= b else 0.0,
+    'seq': lambda a, b: 1.0 if a == b else 0.0,
+    'sne': lambda a, b: 1.0 if a != b else 0.0,
+    'min': min,
+    'max': max,
+}
+
+UNARY_OPS = {
+    'abs': abs,
+    'sin': math.sin,
+    'cos': math.cos,
+    'tan': math.tan,
+    'asin': math.asin,
+    'acos': math.acos,
+    'atan': math.atan,
+    'exp': math.exp,
+    'log': math.log,
+    'sqrt': math.sqrt,
+    'floor': lambda a: float(math.floor(a)),
+    'ceil': lambda a: float(math.ceil(a)),
+    'trunc': lambda a: float(math.trunc(a)),
+    'round': lambda a: float(round(a)),
+}
+
+# Branch if fn(a, b)
+BRANCH_OPS = {
+    'beq': operator.eq,
+    'bne': operator.ne,
+    'blt': operator.lt,
+    'bgt': operator.gt,
+    'ble': operator.le,
+    'bge': operator.ge,
+}
+
+# Branch if fn(a, 0)
+BRANCH_ZERO_OPS = {
+    'beqz': operator.eq,
+    'bnez': operator.ne,
+    'bltz': operator.lt,
+    'bgtz': operator.gt,
+    'blez': operator.le,
+    'bgez': operator.ge,
+}
+
+# Python expressions used by the compiled mode, {a} and {b} are the source operands
+BINARY_EXPRS = {
+    'and': '({a} and {b})',
+    'or': '({a} or {b})',
+    'xor': 'float(bool({a}) != bool({b}))',
+    'add': '{a} + {b}',
+    'sub': '{a} - {b}',
+    'mul': '{a} * {b}',
+    'div': '{a} / {b}',
+    'mod': '{a} % {b}',
+    'slt': '(1.0 if {a} < {b} else 0.0)',
+    'sgt': '(1.0 if {a} > {b} else 0.0)',
+    'sle': '(1.0 if {a} <= {b} else 0.0)',
+    'sge': '(1.0 if {a} >= {b} else 0.0)',
+    'seq': '(1.0 if {a} == {b} else 0.0)',
+    'sne': '(1.0 if {a} != {b} else 0.0)',
+    'min': 'min({a}, {b})',
+    'max': 'max({a}, {b})',
+}
+
+BRANCH_EXPRS = {
+    'beq': '{a} == {b}',
+    'bne': '{a} != {b}',
+    'blt': '{a} < {b}',
+    'bgt': '{a} > {b}',
+    'ble': '{a} <= {b}',
+    'bge': '{a} >= {b}',
+    'beqz': '{a} == 0.0',
+    'bnez': '{a} != 0.0',
+    'bltz': '{a} < 0.0',
+    'bgtz': '{a} > 0.0',
+    'blez': '{a} <= 0.0',
+    'bgez': '{a} >= 0.0',
+}
+
+# Instructions that end a basic block
+CONTROL_OPS = {'j'} | TICK_ENDS | set(BRANCH_OPS) | set(BRANCH_ZERO_OPS)
+
+
+class Block:
+    def __init__(self, fn, count):
+        self.fn = fn
+        # Instructions charged to the tick budget, including a closing yield or sleep
+        self.count = count
 
 
 class MIPSVM:
+    """
+    Test interpreter for the compiled IC10 code.
+
+    parse() decodes every line once into a closure with its operands resolved: registers become
+    indexes into a float register file, immediates are parsed to floats and jump targets to ints.
+    """
 
     MAX_INST = 128
-    def __init__(self, program=None):
+    def __init__(self, program=None, compiled=False):
+        """
+        :param compiled: translate every basic block to one Python function instead of
+                         dispatching instruction by instruction
+        """
+        self.compiled = compiled
+        self._blocks = []
         self._indput = {}
-        self._output = {f'o': 0 for k in range(1)}
-        self._registers = {f'r{k}': 0 for k in range(15)}
+        self._regs = [0.0] * len(REGISTERS)
+        self._stack = [0.0] * STACK_SIZE
         self._pc = 0
         self._no_inst = 0
+        # Instructions run by the last tick, counted like TickBudget
+        self.tick_inst = 0
         self._program = []
+        self._code = []
         self.mips_len = None
+        # Highest register read by the program
         self.highest_register_used = 0
         self._total_sleep = 0
         if program:
@@ -37,169 +168,360 @@ class MIPSVM:
         for k, v in self._indput.items():
             ret.append(f'{k}: {v}')
 
-        ret.append('Output')
-        for k, v in self._output.items():
-            ret.append(f'{k}: {v}')
-
         ret.append('Registers')
-        for k, v in self._registers.items():
-            ret.append(f'{k}: {v}')
+        for k, v in REGISTERS.items():
+            ret.append(f'{k}: {self._regs[v]}')
 
         return "\n".join(ret)
 
-    def _next_inst(self):
-        if self._pc >= len(self._program):
-            return None
-        ret = self._program[self._pc]
-        self._pc += 1
-        return ret
-
     def parse(self, program):
         for line in program.strip().split('\n'):
-            args = line.split(' ')
-            self._program.append(args)
+            line = line.split('//')[0].split('#')[0]
+            args = line.split()
+            if args:
+                self._program.append(args)
+        self._code = [self._decode(args) for args in self._program]
+        self._code.append(lambda: HALT)
+        if self.compiled:
+            self._blocks = self._translate()
 
     def get_total_sleep(self)-> float:
         return self._total_sleep
 
     def get_variable(self, variable):
-        return float(self._get_variable(variable))
-
-    def _get_variable(self, variable):
-        if variable in self._registers:
-            reg_id = int(variable[1:])
-            self.highest_register_used = max(reg_id, self.highest_register_used)
-            return self._registers[variable]
-        elif variable in self._indput:
-            return self._indput[variable]
-        elif variable in self._output:
-            return self._output[variable]
+        if variable in REGISTERS:
+            return self._regs[REGISTERS[variable]]
         try:
-            float(variable)
-        except Exception as exc:
+            return float(self._indput[variable])
+        except KeyError:
             print(f"unable to find variable {variable}")
-            raise
-        return variable
-
-    def _set_variable(self, variable, value):
-        if variable in self._registers:
-            self._registers[variable] = value
-        elif variable in self._indput:
-            self._indput[variable] = value
-        elif variable in self._output:
-            self._output[variable] = value
-        else:
             raise Exception(f"Unknown variable {variable}")
 
-    def _execute_inst(self, args):
+    def get_stack(self, slot):
+        return self._stack[slot]
+
+    def _register(self, operand):
+        if operand not in REGISTERS:
+            raise Exception(f"Unknown variable {operand}")
+        return REGISTERS[operand]
+
+    def _operand(self, operand):
+        """
+        :return: (register index, None) for a register or (None, value) for an immediate
+        """
+        if operand in REGISTERS:
+            index = REGISTERS[operand]
+            if index < 16:
+                self.highest_register_used = max(index, self.highest_register_used)
+            return index, None
+        try:
+            return None, float(operand)
+        except ValueError:
+            raise Exception(f"unable to find variable {operand}")
+
+    def _getter(self, operand):
+        regs = self._regs
+        index, value = self._operand(operand)
+        if index is None:
+            return lambda: value
+        return lambda: regs[index]
+
+    def _decode(self, args):
+        try:
+            return self._decode_inst(args)
+        except Exception as exc:
+            # Report bad operands when the instruction runs, as the game does
+            def inst():
+                raise exc
+            return inst
+
+    def _decode_inst(self, args):
         inst = args[0]
+        regs = self._regs
+        devices = self._indput
 
         if inst == 'yield':
-            return False
+            return lambda: YIELD
         elif inst == 'j':
-            self._pc = int(args[1])
+            target = self._target(args[1])
+            return lambda: target
+        elif inst in BINARY_OPS:
+            return self._decode_binary(BINARY_OPS[inst], args[1], args[2], args[3])
+        elif inst in UNARY_OPS:
+            fn = UNARY_OPS[inst]
+            dst = self._register(args[1])
+            a = self._getter(args[2])
+
+            def unary():
+                regs[dst] = fn(a())
+            return unary
+        elif inst in BRANCH_OPS:
+            return self._decode_branch(BRANCH_OPS[inst], args[1], args[2], self._target(args[3]))
+        elif inst in BRANCH_ZERO_OPS:
+            return self._decode_branch(BRANCH_ZERO_OPS[inst], args[1], '0', self._target(args[2]))
+        elif inst == 'move':
+            dst = self._register(args[1])
+            index, value = self._operand(args[2])
+            if index is None:
+                def move():
+                    regs[dst] = value
+            else:
+                def move():
+                    regs[dst] = regs[index]
+            return move
+        elif inst == 'select':
+            dst = self._register(args[1])
+            condition, a, b = self._getter(args[2]), self._getter(args[3]), self._getter(args[4])
+
+            def select():
+                regs[dst] = a() if condition() != 0 else b()
+            return select
         elif inst == 'l':
-            self._set_variable(args[1], self._get_variable((args[2], args[3])))
+            dst = self._register(args[1])
+            key = (args[2], args[3])
+
+            def load():
+                regs[dst] = self._load(key)
+            return load
         elif inst == 'ls':
-            self._set_variable(args[1], self._get_variable((args[2], args[4], int(float(self._get_variable(args[3]))))))
+            dst = self._register(args[1])
+            slot = self._getter(args[3])
+            device, prop = args[2], args[4]
+
+            def load_slot():
+                regs[dst] = self._load((device, prop, int(slot())))
+            return load_slot
         elif inst == 'lr':
-            self._set_variable(args[1], self._get_variable((args[2], 'Reagent', args[3], args[4])))
+            dst = self._register(args[1])
+            key = (args[2], 'Reagent', args[3], args[4])
+
+            def load_reagent():
+                regs[dst] = self._load(key)
+            return load_reagent
         elif inst == 's':
-            self._set_variable((args[1], args[2]), self._get_variable(args[3]))
-        elif inst == 'move':
-            self._set_variable(args[1], self._get_variable(args[2]))
-        elif inst == 'and':
-            self._set_variable(args[1], str(float(self._get_variable(args[2])) and float(self._get_variable(args[3]))))
-        elif inst == 'or':
-            self._set_variable(args[1], str(float(self._get_variable(args[2])) or float(self._get_variable(args[3]))))
-        elif inst == 'xor':
-            self._set_variable(args[1], str(int(bool(float(self._get_variable(args[2]))) != bool(float(self._get_variable(args[3]))))))
-        elif inst == 'add':
-            self._set_variable(args[1], str(float(self._get_variable(args[2])) + float(self._get_variable(args[3]))))
-        elif inst == 'sub':
-            self._set_variable(args[1], str(float(self._get_variable(args[2])) - float(self._get_variable(args[3]))))
-        elif inst == 'mul':
-            self._set_variable(args[1], str(float(self._get_variable(args[2])) * float(self._get_variable(args[3]))))
-        elif inst == 'div':
-            self._set_variable(args[1], str(float(self._get_variable(args[2])) / float(self._get_variable(args[3]))))
-        elif inst == 'mod':
-            self._set_variable(args[1], str(float(self._get_variable(args[2])) % float(self._get_variable(args[3]))))
-        elif inst == 'slt':
-            self._set_variable(args[1], str(1 if float(self._get_variable(args[2])) < float(self._get_variable(args[3])) else 0))
-        elif inst == 'sgt':
-            self._set_variable(args[1], str(1 if float(self._get_variable(args[2])) > float(self._get_variable(args[3])) else 0))
-        elif inst == 'sle':
-            self._set_variable(args[1], str(1 if float(self._get_variable(args[2])) <= float(self._get_variable(args[3])) else 0))
-        elif inst == 'sge':
-            self._set_variable(args[1], str(1 if float(self._get_variable(args[2])) >= float(self._get_variable(args[3])) else 0))
-        elif inst == 'seq':
-            self._set_variable(args[1], str(1 if float(self._get_variable(args[2])) == float(self._get_variable(args[3])) else 0))
-        elif inst == 'sne':
-            self._set_variable(args[1], str(1 if float(self._get_variable(args[2])) != float(self._get_variable(args[3])) else 0))
-        elif inst == 'bgtz':
-            if float(self._get_variable(args[1])) > 0:
-                self._pc = int(args[2])
-        elif inst == 'beq':
-            if float(self._get_variable(args[1])) == float(self._get_variable(args[2])):
-                self._pc = int(args[3])
-        elif inst == 'bne':
-            if float(self._get_variable(args[1])) != float(self._get_variable(args[2])):
-                self._pc = int(args[3])
-        elif inst == 'min':
-            self._set_variable(args[1], str(min(float(self._get_variable(args[2])), float(self._get_variable(args[3])))))
-        elif inst == 'max':
-            self._set_variable(args[1], str(max(float(self._get_variable(args[2])), float(self._get_variable(args[3])))))
+            key = (args[1], args[2])
+            src = self._getter(args[3])
+
+            def save():
+                if key not in devices:
+                    raise Exception(f"Unknown variable {key}")
+                devices[key] = src()
+            return save
         elif inst == 'sleep':
-            self._total_sleep += float(self._get_variable(args[1]))
+            a = self._getter(args[1])
+
+            def sleep():
+                self._total_sleep += a()
+                return YIELD
+            return sleep
+        elif inst == 'push':
+            a = self._getter(args[1])
+            stack = self._stack
+
+            def push():
+                stack[int(regs[SP])] = a()
+                regs[SP] += 1
+            return push
+        elif inst == 'pop':
+            dst = self._register(args[1])
+            stack = self._stack
+
+            def pop():
+                regs[SP] -= 1
+                regs[dst] = stack[int(regs[SP])]
+            return pop
+        elif inst == 'peek':
+            dst = self._register(args[1])
+            stack = self._stack
+
+            def peek():
+                regs[dst] = stack[int(regs[SP]) - 1]
+            return peek
         elif inst == 'rand':
-            # Set random to 0.5 for unitest
-            self._set_variable(args[1], str(float(0.5)))
-        elif inst == 'cos':
-            self._set_variable(args[1], str(math.cos(float(self._get_variable(args[2])))))
-        elif inst == 'sin':
-            self._set_variable(args[1], str(math.sin(float(self._get_variable(args[2])))))
-        elif inst == 'tam':
-            self._set_variable(args[1], str(math.tan(float(self._get_variable(args[2])))))
-        elif inst == 'acos':
-            self._set_variable(args[1], str(math.acos(float(self._get_variable(args[2])))))
-        elif inst == 'asin':
-            self._set_variable(args[1], str(math.asin(float(self._get_variable(args[2])))))
-        elif inst == 'atam':
-            self._set_variable(args[1], str(math.atan(float(self._get_variable(args[2])))))
-        elif inst == 'mod':
-            self._set_variable(args[1], str(float(self._get_variable(args[2])) % float(self._get_variable(args[3]))))
-        elif inst == 'abs':
-            self._set_variable(args[1], str(abs(float(self._get_variable(args[2])))))
-        elif inst == 'exp':
-            self._set_variable(args[1], str(math.exp(float(self._get_variable(args[2])))))
-        elif inst == 'floor':
-            self._set_variable(args[1], str(math.floor(float(self._get_variable(args[2])))))
-        elif inst == 'ceil':
-            self._set_variable(args[1], str(math.ceil(float(self._get_variable(args[2])))))
-        elif inst == 'log':
-            self._set_variable(args[1], str(math.log(float(self._get_variable(args[2])))))
-        elif inst == 'round':
-            self._set_variable(args[1], str(round(float(self._get_variable(args[2])))))
-        elif inst == 'sqrt':
-            self._set_variable(args[1], str(math.sqrt(float(self._get_variable(args[2])))))
-
-        return True
+            dst = self._register(args[1])
+
+            def rand():
+                # Set random to 0.5 for unitest
+                regs[dst] = 0.5
+            return rand
+
+        # alias and unknown instructions only cost a line
+        return lambda: None
+
+    def _target(self, operand):
+        # Jumps past the end land on the HALT sentinel
+        return min(int(operand), len(self._program))
+
+    def _decode_branch(self, fn, a, b, target):
+        regs = self._regs
+        index_a, value_a = self._operand(a)
+        index_b, value_b = self._operand(b)
+        if index_a is not None and index_b is not None:
+            return lambda: target if fn(regs[index_a], regs[index_b]) else None
+        elif index_a is not None:
+            return lambda: target if fn(regs[index_a], value_b) else None
+        elif index_b is not None:
+            return lambda: target if fn(value_a, regs[index_b]) else None
+        return lambda: target if fn(value_a, value_b) else None
+
+    def _decode_binary(self, fn, dst, a, b):
+        regs = self._regs
+        dst = self._register(dst)
+        index_a, value_a = self._operand(a)
+        index_b, value_b = self._operand(b)
+        if index_a is not None and index_b is not None:
+            def binary():
+                regs[dst] = fn(regs[index_a], regs[index_b])
+        elif index_a is not None:
+            def binary():
+                regs[dst] = fn(regs[index_a], value_b)
+        elif index_b is not None:
+            def binary():
+                regs[dst] = fn(value_a, regs[index_b])
+        else:
+            def binary():
+                regs[dst] = fn(value_a, value_b)
+        return binary
+
+    def _leaders(self):
+        leaders = {0}
+        for pc, args in enumerate(self._program):
+            if args[0] in CONTROL_OPS:
+                leaders.add(pc + 1)
+                if args[0] not in TICK_ENDS:
+                    try:
+                        leaders.add(self._target(args[-1]))
+                    except ValueError:
+                        pass
+        return sorted(leader for leader in leaders if leader < len(self._program))
+
+    def _source_operand(self, operand):
+        index, value = self._operand(operand)
+        return repr(value) if index is None else f'r[{index}]'
+
+    def _translate_inst(self, pc, args):
+        """Python statement for a non control instruction, falls back to the decoded closure"""
+        inst = args[0]
+        try:
+            if inst in BINARY_EXPRS:
+                a, b = self._source_operand(args[2]), self._source_operand(args[3])
+                return f'r[{self._register(args[1])}] = ' + BINARY_EXPRS[inst].format(a=a, b=b)
+            elif inst == 'move':
+                return f'r[{self._register(args[1])}] = {self._source_operand(args[2])}'
+            elif inst == 'select':
+                condition, a, b = (self._source_operand(operand) for operand in args[2:5])
+                return f'r[{self._register(args[1])}] = {a} if {condition} != 0.0 else {b}'
+            elif inst == 'l':
+                return f'r[{self._register(args[1])}] = load({(args[2], args[3])!r})'
+            elif inst == 'alias':
+                return 'pass'
+        except Exception:
+            pass
+        return f'code[{pc}]()'
+
+    def _translate_block(self, start, end, namespace):
+        lines = [f'def block_{start}():']
+        count = 0
+        next_pc = end
+        for pc in range(start, end):
+            args = self._program[pc]
+            inst = args[0]
+            count += 1
+            if inst in TICK_ENDS:
+                if inst == 'sleep':
+                    lines.append(f'    code[{pc}]()')
+                lines.append(f'    return {pc + 1}, {count}, True')
+                break
+            if inst == 'j':
+                next_pc = self._target(args[1])
+            elif inst in BRANCH_EXPRS:
+                try:
+                    if inst in BRANCH_ZERO_OPS:
+                        a, b, target = self._source_operand(args[1]), None, self._target(args[2])
+                    else:
+                        a, b, target = self._source_operand(args[1]), self._source_operand(args[2]), self._target(args[3])
+                    condition = BRANCH_EXPRS[inst].format(a=a, b=b)
+                except Exception:
+                    condition, target = f'code[{pc}]() is not None', None
+                if target is None:
+                    lines.append(f'    t = code[{pc}]()')
+                    lines.append(f'    if t is not None:')
+                    lines.append(f'        return t, {count}, False')
+                else:
+                    lines.append(f'    if {condition}:')
+                    lines.append(f'        return {target}, {count}, False')
+            else:
+                lines.append('    ' + self._translate_inst(pc, args))
+        else:
+            lines.append(f'    return {next_pc}, {count}, False')
+        exec('\n'.join(lines), namespace)
+        return Block(namespace[f'block_{start}'], count)
+
+    def _translate(self):
+        """
+        Split the program into basic blocks at labels and after control instructions
+        and compile each block to a function returning (next pc, instructions, yielded)
+        """
+        namespace = {'r': self._regs, 'code': self._code, 'load': self._load}
+        blocks = [None] * (len(self._program) + 1)
+        leaders = self._leaders()
+        for start, end in zip(leaders, leaders[1:] + [len(self._program)]):
+            blocks[start] = self._translate_block(start, end, namespace)
+        return blocks
+
+    def _load(self, key):
+        try:
+            return float(self._indput[key])
+        except KeyError:
+            print(f"unable to find variable {key}")
+            raise Exception(f"Unknown variable {key}")
 
     def execute(self, indput=None):
+        """Run one tick, until yield or sleep, the end of the program or MAX_INST instructions"""
         try:
             if indput:
                 for k, v in indput.items():
-                    self._indput[k] = v
-
-            while self._no_inst < self.MAX_INST:
-                inst = self._next_inst()
-                if not inst:
-                    break
-                ret = self._execute_inst(inst)
-                if not ret:
-                    self._no_inst = 0
-                    break
-                self._no_inst += 1
+                    self._indput[k] = float(v)
+
+            code = self._code
+            blocks = self._blocks
+            max_inst = self.MAX_INST
+            pc = self._pc
+            no_inst = self._no_inst
+            try:
+                while no_inst < max_inst:
+                    block = blocks[pc] if blocks else None
+                    if block is not None and no_inst + block.count <= max_inst:
+                        pc, count, yielded = block.fn()
+                        no_inst += count
+                        if yielded:
+                            self.tick_inst = no_inst
+                            no_inst = 0
+                            break
+                        continue
+                    # Not at a block start or the block would overrun the tick, step one instruction
+                    ret = code[pc]()
+                    if ret is None:
+                        pc += 1
+                    elif ret >= 0:
+                        pc = ret
+                    elif ret == YIELD:
+                        # yield and sleep cost a line of the tick they end
+                        pc += 1
+                        self.tick_inst = no_inst + 1
+                        no_inst = 0
+                        break
+                    else:
+                        self.tick_inst = no_inst
+                        break
+                    no_inst += 1
+                else:
+                    # Out of instructions for this tick, continue on the next one
+                    self.tick_inst = no_inst
+                    no_inst = 0
+            finally:
+                self._pc = pc
+                self._no_inst = no_inst
         except Exception as exc:
             print(exc)
             traceback.print_exc()
@@ -0,0 +1,264 @@
+import numpy as np
+
+from compiler.compiler import Compiler
+from unittests.mips_vm import REGISTERS, SP, STACK_SIZE, YIELD
+
+BINARY_OPS = {
+    'and': lambda a, b: np.where(a != 0, b, a),
+    'or': lambda a, b: np.where(a != 0, a, b),
+    'xor': lambda a, b: ((a != 0) != (b != 0)).astype(float),
+    'add': np.add,
+    'sub': np.subtract,
+    'mul': np.multiply,
+    'div': np.divide,
+    'mod': np.mod,
+    'slt': lambda a, b: np.less(a, b).astype(float),
+    'sgt': lambda a, b: np.greater(a, b).astype(float),
+    'sle': lambda a, b: np.less_equal(a, b).astype(float),
+    'sge': lambda a, b: np.greater_equal(a, b).astype(float),
+    'seq': lambda a, b: np.equal(a, b).astype(float),
+    'sne': lambda a, b: np.not_equal(a, b).astype(float),
+    'min': np.minimum,
+    'max': np.maximum,
+}
+
+UNARY_OPS = {
+    'abs': np.abs,
+    'sin': np.sin,
+    'cos': np.cos,
+    'tan': np.tan,
+    'asin': np.arcsin,
+    'acos': np.arccos,
+    'atan': np.arctan,
+    'exp': np.exp,
+    'log': np.log,
+    'sqrt': np.sqrt,
+    'floor': np.floor,
+    'ceil': np.ceil,
+    'trunc': np.trunc,
+    'round': np.round,
+}
+
+BRANCH_OPS = {
+    'beq': np.equal,
+    'bne': np.not_equal,
+    'blt': np.less,
+    'bgt': np.greater,
+    'ble': np.less_equal,
+    'bge': np.greater_equal,
+}
+
+BRANCH_ZERO_OPS = {
+    'beqz': np.equal,
+    'bnez': np.not_equal,
+    'bltz': np.less,
+    'bgtz': np.greater,
+    'blez': np.less_equal,
+    'bgez': np.greater_equal,
+}
+
+
+class BatchMIPSVM:
+    """
+    Runs one program over many scenarios at once, one NumPy lane per scenario.
+
+    Every lane has its own program counter. Each step executes the lowest pending pc for the
+    lanes that are at it, so lanes that took different branches meet again at the join point.
+    Registers and device properties are float arrays with one entry per lane.
+    """
+
+    MAX_INST = 128
+
+    def __init__(self, program=None, lanes=1):
+        self.lanes = lanes
+        self._regs = np.zeros((len(REGISTERS), lanes))
+        self._stack = np.zeros((STACK_SIZE, lanes))
+        self._indput = {}
+        self._pc = np.zeros(lanes, dtype=np.int64)
+        self._total_sleep = np.zeros(lanes)
+        # Instructions every lane ran in the last tick, counted like TickBudget
+        self.tick_inst = np.zeros(lanes, dtype=np.int64)
+        self._program = []
+        self._code = []
+        self.mips_len = None
+        if program:
+            mips = Compiler().compile(program)
+            self.parse(mips)
+            self.mips_len = len(self._program)
+
+    def parse(self, program):
+        for line in program.strip().split('\n'):
+            args = line.split('//')[0].split('#')[0].split()
+            if args:
+                self._program.append(args)
+        self._code = [self._decode(args) for args in self._program]
+
+    def get_total_sleep(self):
+        return self._total_sleep
+
+    def get_variable(self, variable):
+        if variable in REGISTERS:
+            return self._regs[REGISTERS[variable]]
+        if variable not in self._indput:
+            raise Exception(f"Unknown variable {variable}")
+        return self._indput[variable]
+
+    def _register(self, operand):
+        if operand not in REGISTERS:
+            raise Exception(f"Unknown variable {operand}")
+        return REGISTERS[operand]
+
+    def _getter(self, operand):
+        regs = self._regs
+        if operand in REGISTERS:
+            index = REGISTERS[operand]
+            return lambda: regs[index]
+        try:
+            value = float(operand)
+        except ValueError:
+            raise Exception(f"unable to find variable {operand}")
+        return lambda: value
+
+    def _load(self, key):
+        if key not in self._indput:
+            raise Exception(f"Unknown variable {key}")
+        return self._indput[key]
+
+    def _decode(self, args):
+        """
+        :return: function(mask) returning None to fall through, YIELD, a jump target
+                 or (condition, target) for a conditional branch
+        """
+        inst = args[0]
+        regs = self._regs
+
+        if inst == 'yield':
+            return lambda mask: YIELD
+        elif inst == 'j':
+            target = int(args[1])
+            return lambda mask: target
+        elif inst in BRANCH_OPS or inst in BRANCH_ZERO_OPS:
+            if inst in BRANCH_OPS:
+                fn = BRANCH_OPS[inst]
+                a, b = self._getter(args[1]), self._getter(args[2])
+                target = int(args[3])
+            else:
+                fn = BRANCH_ZERO_OPS[inst]
+                a, b = self._getter(args[1]), lambda: 0.0
+                target = int(args[2])
+            return lambda mask: (np.broadcast_to(fn(a(), b()), mask.shape), target)
+        elif inst in BINARY_OPS:
+            fn = BINARY_OPS[inst]
+            dst = self._register(args[1])
+            a, b = self._getter(args[2]), self._getter(args[3])
+            return lambda mask: np.copyto(regs[dst], fn(a(), b()), where=mask)
+        elif inst in UNARY_OPS:
+            fn = UNARY_OPS[inst]
+            dst = self._register(args[1])
+            a = self._getter(args[2])
+            return lambda mask: np.copyto(regs[dst], fn(a()), where=mask)
+        elif inst == 'select':
+            dst = self._register(args[1])
+            condition, a, b = self._getter(args[2]), self._getter(args[3]), self._getter(args[4])
+            return lambda mask: np.copyto(regs[dst], np.where(condition() != 0, a(), b()), where=mask)
+        elif inst == 'move':
+            dst = self._register(args[1])
+            a = self._getter(args[2])
+            return lambda mask: np.copyto(regs[dst], a(), where=mask)
+        elif inst == 'l':
+            dst = self._register(args[1])
+            key = (args[2], args[3])
+            return lambda mask: np.copyto(regs[dst], self._load(key), where=mask)
+        elif inst == 'lr':
+            dst = self._register(args[1])
+            key = (args[2], 'Reagent', args[3], args[4])
+            return lambda mask: np.copyto(regs[dst], self._load(key), where=mask)
+        elif inst == 'ls':
+            dst = self._register(args[1])
+            slot = self._getter(args[3])
+            device, prop = args[2], args[4]
+
+            def load_slot(mask):
+                slots = np.broadcast_to(slot(), mask.shape).astype(int)
+                for value in np.unique(slots[mask]):
+                    np.copyto(regs[dst], self._load((device, prop, int(value))), where=mask & (slots == value))
+            return load_slot
+        elif inst == 's':
+            key = (args[1], args[2])
+            src = self._getter(args[3])
+            return lambda mask: np.copyto(self._load(key), src(), where=mask)
+        elif inst == 'sleep':
+            a = self._getter(args[1])
+
+            def sleep(mask):
+                np.add(self._total_sleep, a(), out=self._total_sleep, where=mask)
+                return YIELD
+            return sleep
+        elif inst in ('push', 'pop', 'peek'):
+            return self._decode_stack(inst, args[1])
+        elif inst == 'rand':
+            dst = self._register(args[1])
+            # Set random to 0.5 for unitest
+            return lambda mask: np.copyto(regs[dst], 0.5, where=mask)
+
+        return lambda mask: None
+
+    def _decode_stack(self, inst, operand):
+        regs = self._regs
+        stack = self._stack
+        lanes = np.arange(self.lanes)
+        sp = regs[SP]
+        if inst == 'push':
+            a = self._getter(operand)
+
+            def push(mask):
+                stack[sp[mask].astype(int), lanes[mask]] = np.broadcast_to(a(), mask.shape)[mask]
+                sp[mask] += 1
+            return push
+
+        dst = self._register(operand)
+        # pop moves sp down before reading, peek reads below sp without moving it
+        step = -1 if inst == 'pop' else 0
+
+        def read(mask):
+            sp[mask] += step
+            index = sp[mask].astype(int) - (step + 1)
+            regs[dst][mask] = stack[index, lanes[mask]]
+        return read
+
+    def execute(self, indput=None):
+        """
+        Run one tick on every lane.
+        :param indput: device properties, a scalar for all lanes or an array with one value per lane
+        """
+        if indput:
+            for k, v in indput.items():
+                self._indput[k] = np.array(np.broadcast_to(np.asarray(v, dtype=float), (self.lanes,)))
+
+        code = self._code
+        end = len(code)
+        pc = self._pc
+        no_inst = np.zeros(self.lanes, dtype=np.int64)
+        running = pc < end
+        with np.errstate(all='ignore'):
+            while running.any():
+                current = pc[running].min()
+                mask = running & (pc == current)
+                ret = code[current](mask)
+                if ret is None:
+                    pc[mask] = current + 1
+                elif isinstance(ret, tuple):
+                    condition, target = ret
+                    pc[mask & condition] = target
+                    pc[mask & ~condition] = current + 1
+                elif ret == YIELD:
+                    # yield and sleep cost a line of the tick they end
+                    pc[mask] = current + 1
+                    no_inst[mask] += 1
+                    running &= ~mask
+                    continue
+                else:
+                    pc[mask] = ret
+                no_inst[mask] += 1
+                running &= (pc < end) & (no_inst < self.MAX_INST)
+        self.tick_inst = no_inst
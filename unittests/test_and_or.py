@@ -1,3 +1,5 @@
+import pytest
+
 from unittests.mips_vm import MIPSVM
 
 
@@ -262,3 +264,60 @@ out = 1 if 1 and 0 else 0
     vm.execute()
     assert vm.get_variable('o') == 0
 
+
+
+def test_condition_and_short_circuit():
+    program = """
+p = label(d0, "Sensor")
+if p.false and p.missing:
+    out = 1
+"""
+    vm = MIPSVM(program)
+    # p.missing is never loaded, the VM raises on unknown properties
+    vm.execute({('d0', 'false'): 0})
+    assert vm.get_variable('o') == 0
+
+
+def test_condition_or_short_circuit():
+    program = """
+p = label(d0, "Sensor")
+if p.true or p.missing:
+    out = 1
+"""
+    vm = MIPSVM(program)
+    vm.execute({('d0', 'true'): 1})
+    assert vm.get_variable('o') == 1
+
+
+@pytest.mark.parametrize('a', [0, 1])
+@pytest.mark.parametrize('b', [0, 1])
+@pytest.mark.parametrize('c', [0, 1])
+def test_condition_nested_short_circuit(a, b, c):
+    program = """
+p = label(d0, "Sensor")
+if (p.a > 0 or p.b == 1) and not p.c:
+    out = 1
+else:
+    out = 2
+while p.a == 1 and (p.b or p.c) and out < 5:
+    out = out + 1
+"""
+    vm = MIPSVM(program)
+    vm.execute({('d0', 'a'): a, ('d0', 'b'): b, ('d0', 'c'): c})
+    out = 1 if (a > 0 or b == 1) and not c else 2
+    while a == 1 and (b or c) and out < 5:
+        out = out + 1
+    assert vm.get_variable('o') == out
+
+
+def test_assignment_and_or_value():
+    program = """
+p = label(d0, "Sensor")
+a = p.true and p.false
+b = p.false or p.true
+out = a + b * 10
+"""
+    vm = MIPSVM(program)
+    vm.execute({('d0', 'true'): 1, ('d0', 'false'): 0})
+    # a is 0 and b is 1
+    assert vm.get_variable('o') == 10
@@ -0,0 +1,48 @@
+from compiler.build_cache import BuildCache, format_stats
+from compiler.compiler import compile_files
+
+
+def test_build_cache_hit(tmp_path):
+    cache = BuildCache(tmp_path / 'cache')
+    script = tmp_path / 'script.py'
+    script.write_text('a = 1\nout = a + 1\n')
+
+    results = compile_files([script], cache=cache)
+    assert not results[0].cached
+    mtime = (tmp_path / 'script.py.mips').stat().st_mtime_ns
+
+    results = compile_files([script], cache=cache)
+    assert results[0].cached
+    assert results[0].output == 'move r0 1\nadd o r0 1'
+    assert (tmp_path / 'script.py.mips').stat().st_mtime_ns == mtime
+    assert format_stats(results) == 'build cache: 1 hits, 0 misses'
+
+
+def test_build_cache_miss_on_change(tmp_path):
+    cache = BuildCache(tmp_path / 'cache')
+    script = tmp_path / 'script.py'
+    script.write_text('out = 1\n')
+    compile_files([script], cache=cache)
+
+    script.write_text('out = 2\n')
+    results = compile_files([script], cache=cache)
+    assert not results[0].cached
+    assert (tmp_path / 'script.py.mips').read_text() == 'move o 2'
+
+
+def test_build_cache_key():
+    cache = BuildCache('unused')
+    assert cache.key('out = 1') == cache.key('out = 1')
+    assert cache.key('out = 1') != cache.key('out = 1', debug=True)
+
+
+def test_build_cache_miss_on_rotate_loops(tmp_path):
+    cache = BuildCache(tmp_path / 'cache')
+    script = tmp_path / 'script.py'
+    script.write_text('i = 0\nwhile i < 3:\n    i = i + 1\nout = i\n')
+    plain = compile_files([script], cache=cache)[0]
+
+    rotated = compile_files([script], cache=cache, rotate_loops=True)[0]
+    assert not rotated.cached
+    assert rotated.output != plain.output
+    assert compile_files([script], cache=cache, rotate_loops=True)[0].cached
@@ -170,7 +170,7 @@ a = max(1 + 10, 20) + min(1 - 2, -25)
     vm = MIPSVM(program)
     vm.execute()
     assert vm.get_variable('r0') == -5
-    assert vm.highest_register_used == 1
+    assert vm.highest_register_used == 0
 
 
 def test_math_min_nested_1():
@@ -180,17 +180,18 @@ a = min(max(1 + 10, 20), min(1 - 2, -20))
     vm = MIPSVM(program)
     vm.execute()
     assert vm.get_variable('r0') == -20
-    assert vm.highest_register_used == 1
+    assert vm.highest_register_used == 0
 
 
 def test_math_min_nested_2():
     program = """
 a = max(max(1 + 20, 20), min(1 - 2, -20))
 b = 100
+out = a + b
 """
     vm = MIPSVM(program)
     vm.execute()
-    assert vm.get_variable('r0') == 21
+    assert vm.get_variable('o') == 121
     assert vm.highest_register_used == 1
 
 
@@ -238,13 +239,16 @@ def test_exception_sleep_return_2():
     program = """
 a = sleep(2)
 b = a + 1
+out = a * 10 + b
 """
     vm = MIPSVM(program)
     vm.execute()
     assert vm.get_total_sleep() == 2
+    # sleep ends the tick, the rest runs on the next one
+    vm.execute()
 
-    assert vm.get_variable('r0') == 0
-    assert vm.get_variable('r1') == 1
+    # a is 0 and b is 1
+    assert vm.get_variable('o') == 1
 
 
 
@@ -266,7 +270,7 @@ a = rand() if True else 0
 """
     vm = MIPSVM(program)
     vm.execute()
-    assert vm.mips_len == 4
+    assert vm.mips_len == 1
     assert vm.get_variable('r0') == 0.5
 
 
@@ -0,0 +1,37 @@
+from compiler.compiler import compile_files
+
+
+def _write_scripts(path):
+    files = []
+    for i in range(4):
+        file = path / f's{i}.py'
+        file.write_text(f'a = {i}\nout = a + 1\n')
+        files.append(file)
+    bad = path / 'bad.py'
+    bad.write_text('out = b\n')
+    files.insert(2, bad)
+    return files
+
+
+def test_compile_files_jobs(tmp_path):
+    files = _write_scripts(tmp_path)
+    results = compile_files(files, jobs=2)
+    assert [result.file for result in results] == files
+    assert [result.file for result in results if result.error] == [tmp_path / 'bad.py']
+    assert (tmp_path / 's3.py.mips').read_text() == 'move r0 3\nadd o r0 1'
+
+
+def test_compile_files_sequential(tmp_path):
+    files = _write_scripts(tmp_path)
+    results = compile_files(files, jobs=1)
+    assert [result.output for result in results] == [result.output for result in compile_files(files, jobs=3)]
+
+
+def test_compile_files_undecodable(tmp_path):
+    files = _write_scripts(tmp_path)
+    undecodable = tmp_path / 'utf16.py'
+    undecodable.write_bytes(b'\xff\xfeo\x00u\x00t\x00')
+    files.append(undecodable)
+    results = compile_files(files, jobs=2)
+    assert [result.file for result in results if result.error] == [tmp_path / 'bad.py', undecodable]
+    assert (tmp_path / 's3.py.mips').read_text() == 'move r0 3\nadd o r0 1'
@@ -0,0 +1,129 @@
+from unittests.mips_vm import MIPSVM
+
+
+def test_fold_arith():
+    program = """
+out = 2 * 3 + 1
+"""
+    vm = MIPSVM(program)
+    vm.execute()
+    assert vm.get_variable('o') == 7
+    assert vm.mips_len == 1
+
+
+def test_fold_builtin():
+    program = """
+out = sqrt(16) + max(1, min(2, 3)) / 4
+"""
+    vm = MIPSVM(program)
+    vm.execute()
+    assert vm.get_variable('o') == 4.5
+    assert vm.mips_len == 1
+
+
+def test_fold_float():
+    program = """
+out = 1 / 3
+"""
+    vm = MIPSVM(program)
+    vm.execute()
+    assert vm.get_variable('o') == 1 / 3
+    assert vm.mips_len == 1
+
+
+def test_fold_negation():
+    program = """
+out = -(2 * 3)
+"""
+    vm = MIPSVM(program)
+    vm.execute()
+    assert vm.get_variable('o') == -6
+    assert vm.mips_len == 1
+
+
+def test_fold_condition():
+    program = """
+if 2 > 1 and not False:
+    out = 1
+else:
+    out = 2
+"""
+    vm = MIPSVM(program)
+    vm.execute()
+    assert vm.get_variable('o') == 1
+    assert vm.mips_len == 1
+
+
+def test_fold_operand():
+    program = """
+out = out + 60 * 60
+"""
+    vm = MIPSVM(program)
+    vm.execute()
+    assert vm.get_variable('o') == 3600
+    assert vm.mips_len == 1
+
+
+def test_no_fold_division_by_zero():
+    # Left for the game to evaluate
+    program = """
+out = 1 / 0
+"""
+    vm = MIPSVM(program)
+    assert vm._program == [['div', 'o', '1', '0']]
+
+
+def test_no_fold_impure():
+    program = """
+a = rand() + 1
+sleep(2 * 3)
+"""
+    vm = MIPSVM(program)
+    vm.execute()
+    assert vm.get_variable('r0') == 1.5
+    assert vm.get_total_sleep() == 6
+    assert vm.mips_len == 3
+
+
+def test_no_fold_negative_mod():
+    # The sign of the result differs between conventions, left for the game to evaluate
+    program = """
+out = -7 % 3
+"""
+    vm = MIPSVM(program)
+    assert vm._program == [['mod', 'o', '-7', '3']]
+
+
+def test_fold_positive_mod():
+    program = """
+out = 7 % 3
+"""
+    vm = MIPSVM(program)
+    assert vm._program == [['move', 'o', '1']]
+
+
+def test_no_fold_round_half():
+    # Halves round to even in Python, left for the game to evaluate
+    program = """
+out = round(2.5)
+"""
+    vm = MIPSVM(program)
+    assert vm._program == [['round', 'o', '2.5']]
+
+
+def test_fold_round():
+    program = """
+out = round(2.4) + round(-2.6)
+"""
+    vm = MIPSVM(program)
+    assert vm._program == [['move', 'o', '-1']]
+
+
+def test_fold_small_immediate():
+    program = """
+out = 1 / 100000
+"""
+    vm = MIPSVM(program)
+    assert vm._program == [['move', 'o', '0.00001']]
+    vm.execute()
+    assert vm.get_variable('o') == 1e-05
@@ -0,0 +1,119 @@
+from compiler.compiler import Compiler
+from unittests.mips_vm import MIPSVM
+
+
+def _stores(program, skip_unchanged_stores=False):
+    compiler = Compiler(skip_unchanged_stores=skip_unchanged_stores)
+    mips = compiler.compile(program)
+    return [line for line in mips.split('\n') if line.startswith('s ')], compiler.dropped_stores
+
+
+def test_overwritten_store():
+    program = """
+pump = label(d1, "Pump")
+pump.On = 0
+pump.Setting = 2
+pump.On = 1
+"""
+    stores, dropped = _stores(program)
+    assert stores == ['s d1 Setting 2', 's d1 On 1']
+    assert dropped['dead'] == 1
+
+    vm = MIPSVM(program)
+    vm.execute({('d1', 'On'): 5, ('d1', 'Setting'): 0})
+    assert vm.get_variable(('d1', 'On')) == 1
+
+
+def test_load_keeps_store():
+    program = """
+pump = label(d1, "Pump")
+pump.On = 3
+out = pump.On
+pump.On = 1
+"""
+    stores, _ = _stores(program)
+    assert len(stores) == 2
+
+    vm = MIPSVM(program)
+    vm.execute({('d1', 'On'): 0})
+    assert vm.get_variable('o') == 3
+
+
+def test_yield_keeps_store():
+    program = """
+pump = label(d1, "Pump")
+pump.On = 0
+yield_tick
+pump.On = 1
+"""
+    stores, _ = _stores(program)
+    assert len(stores) == 2
+
+
+def test_store_overwritten_on_one_path():
+    program = """
+pump = label(d1, "Pump")
+sensor = label(d0, "Sensor")
+pump.On = 0
+if sensor.Pressure > 10:
+    pump.On = 1
+"""
+    stores, _ = _stores(program)
+    assert len(stores) == 2
+
+    vm = MIPSVM(program)
+    vm.execute({('d0', 'Pressure'): 5, ('d1', 'On'): 7})
+    assert vm.get_variable(('d1', 'On')) == 0
+
+
+def test_store_overwritten_on_every_path():
+    program = """
+pump = label(d1, "Pump")
+sensor = label(d0, "Sensor")
+while True:
+    pump.On = 0
+    if sensor.Pressure > 10:
+        pump.On = 1
+    else:
+        pump.On = 0
+    yield_tick
+"""
+    stores, dropped = _stores(program)
+    assert len(stores) == 2
+    assert dropped['dead'] == 1
+
+
+def test_unchanged_store():
+    program = """
+pump = label(d1, "Pump")
+sensor = label(d0, "Sensor")
+pump.On = 1
+while True:
+    if sensor.Pressure > 10:
+        pump.On = 1
+    yield_tick
+"""
+    stores, dropped = _stores(program)
+    assert len(stores) == 2
+    assert dropped['unchanged'] == 0
+
+    stores, dropped = _stores(program, skip_unchanged_stores=True)
+    assert stores == ['s d1 On 1']
+    assert dropped['unchanged'] == 1
+
+
+def test_unchanged_store_of_register():
+    program = """
+pump = label(d1, "Pump")
+sensor = label(d0, "Sensor")
+a = sensor.Pressure
+pump.Setting = a
+yield_tick
+pump.Setting = a
+yield_tick
+a = a + 1
+pump.Setting = a
+"""
+    stores, dropped = _stores(program, skip_unchanged_stores=True)
+    assert len(stores) == 2
+    assert dropped['unchanged'] == 1
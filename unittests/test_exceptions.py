@@ -1,7 +1,7 @@
 import pytest
 
 from compiler.exceptions import MipsUnboundLocalError, MipsAttributeError, MipsNameError, MipsSyntaxError, MipsTypeErrorToManyArguments, \
-    MipsTypeErrorMissingArguments
+    MipsTypeErrorMissingArguments, MipsNotSupportedError
 from unittests.mips_vm import MIPSVM
 
 
@@ -113,3 +113,11 @@ a = min(1, 2, 3)
 """
     with pytest.raises(MipsTypeErrorToManyArguments):
         vm = MIPSVM(program)
+
+
+def test_exception_not_supported_1():
+    program = """
+pass
+"""
+    with pytest.raises(MipsNotSupportedError):
+        vm = MIPSVM(program)
@@ -10,7 +10,7 @@ out = 1 if 0 else 2
     vm = MIPSVM(program)
     vm.execute()
     assert vm.get_variable('o') == 2
-    assert vm.mips_len == 4
+    assert vm.mips_len == 1
 
 
 def test_if_else_ternary_true():
@@ -20,7 +20,7 @@ out = 1 if 1 else 2
     vm = MIPSVM(program)
     vm.execute()
     assert vm.get_variable('o') == 1
-    assert vm.mips_len == 4
+    assert vm.mips_len == 1
 
 
 def test_if_else_ternary_expr_l_true():
@@ -49,7 +49,7 @@ if 1 == 0:
     vm = MIPSVM(program)
     vm.execute()
     assert vm.get_variable('o') == 0
-    assert vm.mips_len == 2
+    assert vm.mips_len == 0
 
 
 def test_if_true_eq():
@@ -60,7 +60,7 @@ if 1 == 1:
     vm = MIPSVM(program)
     vm.execute()
     assert vm.get_variable('o') == 1
-    assert vm.mips_len == 2
+    assert vm.mips_len == 1
 
 
 def test_if_false():
@@ -71,7 +71,7 @@ if 0:
     vm = MIPSVM(program)
     vm.execute()
     assert vm.get_variable('o') == 0
-    assert vm.mips_len == 2
+    assert vm.mips_len == 0
 
 
 def test_if_true():
@@ -82,7 +82,7 @@ if 1:
     vm = MIPSVM(program)
     vm.execute()
     assert vm.get_variable('o') == 1
-    assert vm.mips_len == 2
+    assert vm.mips_len == 1
 
 
 def test_if_neg():
@@ -93,7 +93,7 @@ if -1:
     vm = MIPSVM(program)
     vm.execute()
     assert vm.get_variable('o') == 1
-    assert vm.mips_len == 2
+    assert vm.mips_len == 1
 
 
 def test_if_else_false():
@@ -106,7 +106,7 @@ else:
     vm = MIPSVM(program)
     vm.execute()
     assert vm.get_variable('o') == 2
-    assert vm.mips_len == 4
+    assert vm.mips_len == 1
 
 
 def test_if_else_true():
@@ -119,7 +119,7 @@ else:
     vm = MIPSVM(program)
     vm.execute()
     assert vm.get_variable('o') == 1
-    assert vm.mips_len == 4
+    assert vm.mips_len == 1
 
 
 def test_if_then_else_true_false():
@@ -134,7 +134,7 @@ else:
     vm = MIPSVM(program)
     vm.execute()
     assert vm.get_variable('o') == 1
-    assert vm.mips_len == 7
+    assert vm.mips_len == 1
 
 
 def test_if_then_else_true_true():
@@ -149,7 +149,7 @@ else:
     vm = MIPSVM(program)
     vm.execute()
     assert vm.get_variable('o') == 1
-    assert vm.mips_len == 7
+    assert vm.mips_len == 1
 
 
 def test_if_then_else_false_true():
@@ -164,7 +164,7 @@ else:
     vm = MIPSVM(program)
     vm.execute()
     assert vm.get_variable('o') == 2
-    assert vm.mips_len == 7
+    assert vm.mips_len == 1
 
 
 def test_if_then_else_false_false():
@@ -179,7 +179,7 @@ else:
     vm = MIPSVM(program)
     vm.execute()
     assert vm.get_variable('o') == 3
-    assert vm.mips_len == 7
+    assert vm.mips_len == 1
 
 
 def test_if_else_ternary_false_expr():
@@ -390,3 +390,80 @@ valve.On = False
 """
     vm = MIPSVM(program)
     vm.execute({('d0', 'Pressure'): 1, ('db', 'Setting'): 1})
+
+
+@pytest.mark.parametrize('op, expected', [('<', 2), ('>', 1), ('<=', 2), ('>=', 1), ('==', 2), ('!=', 1)])
+def test_if_compare_branch(op, expected):
+    program = f"""
+sensor = label(d0, "Sensor")
+if sensor.Setting {op} 0:
+    out = 1
+else:
+    out = out + 2
+"""
+    vm = MIPSVM(program)
+    vm.execute({('d0', 'Setting'): 5})
+    assert vm.get_variable('o') == expected
+    # One fused compare with zero, no slt into a register
+    assert vm.mips_len == 6
+    assert vm.highest_register_used == 0
+
+
+@pytest.mark.parametrize('value, expected', [(1, 2), (3, 1)])
+def test_if_compare_branch_registers(value, expected):
+    program = f"""
+a = {value}
+b = 2
+if a < b:
+    out = 2
+else:
+    out = out + 1
+"""
+    vm = MIPSVM(program)
+    vm.execute()
+    assert vm.get_variable('o') == expected
+    assert vm.mips_len == 6
+
+
+@pytest.mark.parametrize('value, expected', [(0, 2), (5, 1)])
+def test_if_else_select(value, expected):
+    program = """
+sensor = label(d0, "Sensor")
+b = 2
+if sensor.Setting > 0:
+    out = 1
+else:
+    out = b
+"""
+    vm = MIPSVM(program)
+    vm.execute({('d0', 'Setting'): value})
+    assert vm.get_variable('o') == expected
+    assert vm.mips_len == 5
+    assert 'select' in [args[0] for args in vm._program]
+
+
+@pytest.mark.parametrize('value, expected', [(0, 3), (5, 4)])
+def test_if_else_ternary_select(value, expected):
+    program = """
+sensor = label(d0, "Sensor")
+a = 3
+a = 4 if sensor.Setting else a
+"""
+    vm = MIPSVM(program, compiled=True)
+    vm.execute({('d0', 'Setting'): value})
+    assert vm.get_variable('r0') == expected
+    assert vm.mips_len == 4
+
+
+def test_if_else_not_select():
+    program = """
+sensor = label(d0, "Sensor")
+if sensor.Setting:
+    out = 1
+else:
+    a = 2
+"""
+    vm = MIPSVM(program)
+    vm.execute({('d0', 'Setting'): 1})
+    assert vm.get_variable('o') == 1
+    assert 'select' not in [args[0] for args in vm._program]
@@ -34,3 +34,16 @@ while True:
 
 
 
+
+
+def test_labels_braces():
+    program = """
+sensor = label(d0, "{Sensor}")
+while sensor.Pressure < 10:
+    out = sensor.Pressure
+    yield_tick
+"""
+
+    vm = MIPSVM(program)
+    vm.execute({('d0', 'Pressure'): 1})
+    assert vm.get_variable('o') == 1
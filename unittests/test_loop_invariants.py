@@ -0,0 +1,79 @@
+from compiler.compiler import Compiler
+from unittests.mips_vm import MIPSVM
+
+
+def _hoisted(program):
+    compiler = Compiler()
+    compiler.compile(program)
+    return compiler.hoisted['hoisted']
+
+
+def test_hoist_invariant_expression():
+    program = """
+a = 3
+b = 4
+i = 0
+while i < 10:
+    i = i + a * b
+out = i
+"""
+    assert _hoisted(program) == 1
+
+    vm = MIPSVM(program)
+    vm.execute()
+    assert vm.get_variable('o') == 12
+
+
+def test_keep_value_read_after_loop():
+    program = """
+a = 3
+b = 4
+i = 0
+c = 0
+while i < 10:
+    c = a * b
+    i = i + c
+out = c
+"""
+    # The loop may not run, c must keep its value from before the loop
+    assert _hoisted(program) == 0
+
+    vm = MIPSVM(program)
+    vm.execute()
+    assert vm.get_variable('o') == 12
+
+
+def test_keep_loop_carried_value():
+    program = """
+a = 3
+i = 0
+while i < 10:
+    a = a * 2
+    i = i + 1
+out = a
+"""
+    assert _hoisted(program) == 0
+
+    vm = MIPSVM(program)
+    vm.execute()
+    assert vm.get_variable('o') == 3 * 2 ** 10
+
+
+def test_hoist_chain_keeps_device_loads():
+    program = """
+sensor = label(d0, "Sensor")
+pump = label(d1, "Pump")
+target = sensor.Setting
+while True:
+    limit = target * 2 + 5
+    pump.Setting = sensor.Pressure * (target - 3) + limit
+    yield_tick
+"""
+    assert _hoisted(program) == 3
+
+    vm = MIPSVM(program)
+    assert vm.mips_len == 12
+    vm.execute({('d0', 'Setting'): 4, ('d0', 'Pressure'): 10, ('d1', 'Setting'): 0})
+    assert vm.get_variable(('d1', 'Setting')) == 23
+    vm.execute({('d0', 'Pressure'): 20})
+    assert vm.get_variable(('d1', 'Setting')) == 33
@@ -0,0 +1,94 @@
+import pytest
+
+from unittests.mips_vm import MIPSVM
+
+
+def test_vm_decoded_registers():
+    vm = MIPSVM()
+    vm.parse("move r0 2\nmul r1 r0 1.5\ntan r2 0\nsub o r1 r2")
+    vm.execute()
+    assert vm.get_variable('r1') == 3.0
+    assert vm.get_variable('o') == 3.0
+    assert vm.highest_register_used == 2
+
+
+def test_vm_tick_budget():
+    vm = MIPSVM()
+    vm.parse("add r0 r0 1\nj 0")
+    vm.execute()
+    assert vm.get_variable('r0') == MIPSVM.MAX_INST / 2
+    vm.execute()
+    assert vm.get_variable('r0') == MIPSVM.MAX_INST
+
+
+def test_vm_jump_past_end():
+    vm = MIPSVM()
+    vm.parse("j 5\nmove o 1")
+    vm.execute()
+    assert vm.get_variable('o') == 0
+
+
+def test_vm_compiled_budget_split():
+    program = "add r0 r0 1\nadd r1 r0 r1\nj 0"
+    vms = [MIPSVM(compiled=compiled) for compiled in (False, True)]
+    for vm in vms:
+        vm.parse(program)
+    for _ in range(3):
+        for vm in vms:
+            vm.execute()
+        assert vms[0].get_variable('r0') == vms[1].get_variable('r0')
+        assert vms[0].get_variable('r1') == vms[1].get_variable('r1')
+        assert vms[0]._pc == vms[1]._pc
+
+
+def test_vm_compiled_program():
+    program = """
+sensor = label(d0, "Sensor")
+while True:
+    if sensor.Pressure > 10:
+        out = out + 1
+    else:
+        out = max(out - 1, 0)
+    yield_tick
+"""
+    vms = [MIPSVM(program, compiled=compiled) for compiled in (False, True)]
+    for pressure in [20, 20, 0, 30, 0, 0, 0]:
+        for vm in vms:
+            vm.execute({('d0', 'Pressure'): pressure})
+        assert vms[0].get_variable('o') == vms[1].get_variable('o')
+    assert vms[1].get_variable('o') == 0
+
+
+def test_stack():
+    vm = MIPSVM()
+    vm.parse("""
+push 3
+push 4
+pop r0
+peek r1
+move sp 5
+push 7
+""")
+    vm.execute()
+    assert vm.get_variable('r0') == 4
+    assert vm.get_variable('r1') == 3
+    assert vm.get_stack(5) == 7
+    assert vm.get_variable('sp') == 6
+
+
+@pytest.mark.parametrize('compiled', [False, True])
+@pytest.mark.parametrize('branch, value, taken', [
+    ('blt r0 2', 1, True), ('blt r0 2', 2, False), ('bgt r0 2', 3, True), ('ble r0 2', 2, True),
+    ('bge r0 2', 1, False), ('beqz r0', 0, True), ('bnez r0', 0, False), ('bltz r0', -1, True),
+    ('blez r0', 1, False), ('bgez r0', 0, True), ('bgtz r0', 0, False)])
+def test_compare_branches(compiled, branch, value, taken):
+    vm = MIPSVM(compiled=compiled)
+    vm.parse(f"""
+move r0 {value}
+{branch} 4
+move o 1
+j 5
+move o 2
+""")
+    vm.execute()
+    assert vm.get_variable('o') == (2 if taken else 1)
@@ -0,0 +1,91 @@
+import itertools
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from compiler.compiler import Compiler
+from unittests.mips_vm import MIPSVM
+from unittests.mips_vm_batch import BatchMIPSVM
+
+program = """
+sensor = label(d0, "Sensor")
+pump = label(d1, "Pump")
+while True:
+    pressure = sensor.Pressure
+    if pressure > db.Setting + 10:
+        pump.On = 0
+    elif pressure < db.Setting:
+        pump.On = min(1, db.Setting - pressure)
+    out = pressure * 2 if sensor.Open else 0
+    yield_tick
+"""
+
+
+def test_batch_matches_scalar():
+    scenarios = list(itertools.product([0, 5, 50, 100], [0, 1], [0, 20, 60]))
+    pressures, opens, settings = (np.array(values, dtype=float) for values in zip(*scenarios))
+
+    vm = BatchMIPSVM(program, lanes=len(scenarios))
+    vm.execute({('d0', 'Pressure'): pressures, ('d0', 'Open'): opens,
+                ('db', 'Setting'): settings, ('d1', 'On'): 0.5})
+    vm.execute()
+
+    for lane, (pressure, open_, setting) in enumerate(scenarios):
+        scalar = MIPSVM(program)
+        scalar.execute({('d0', 'Pressure'): pressure, ('d0', 'Open'): open_,
+                        ('db', 'Setting'): setting, ('d1', 'On'): 0.5})
+        scalar.execute()
+        assert vm.get_variable('o')[lane] == scalar.get_variable('o')
+        assert vm.get_variable(('d1', 'On'))[lane] == scalar.get_variable(('d1', 'On'))
+
+
+def test_batch_divergent_loop():
+    vm = BatchMIPSVM("""
+while out < db.Setting:
+    out += 1
+""", lanes=3)
+    vm.execute({('db', 'Setting'): np.array([0, 3, 7])})
+    assert list(vm.get_variable('o')) == [0, 3, 7]
+
+
+def test_batch_tick_budget():
+    vm = BatchMIPSVM(lanes=2)
+    vm.parse("add r0 r0 1\nj 0")
+    vm.execute()
+    assert list(vm.get_variable('r0')) == [BatchMIPSVM.MAX_INST / 2] * 2
+
+
+def test_batch_spilled_program():
+    program = '\n'.join(f'v{i} = db.Setting + {i}' for i in range(20))
+    program += '\nout = ' + ' + '.join(f'v{i}' for i in range(20)) + '\n'
+    vm = BatchMIPSVM(program, lanes=2)
+    vm.execute({('db', 'Setting'): np.array([0, 1])})
+    assert list(vm.get_variable('o')) == [sum(range(20)), sum(range(20)) + 20]
+
+
+def test_batch_select():
+    vm = BatchMIPSVM(lanes=3)
+    vm.parse("select r0 r1 2 3\nmove o r0")
+    vm._regs[1] = [0, 1, -1]
+    vm.execute()
+    assert list(vm.get_variable('o')) == [3, 2, 2]
+
+
+def test_batch_tick_inst_matches_report():
+    program = """
+sensor = label(d0, "Sensor")
+while True:
+    if sensor.Pressure > 3:
+        out = sensor.Pressure * 2
+    sleep(1)
+"""
+    compiler = Compiler()
+    compiler.compile(program)
+    first = compiler.tick_report()['segments'][0]
+    vm = BatchMIPSVM(program, lanes=2)
+    vm.execute({('d0', 'Pressure'): np.array([0, 5])})
+    # Only the high pressure lane takes the longest path, both count the sleep
+    assert vm.tick_inst[0] < first['instructions']
+    assert vm.tick_inst[1] == first['instructions']
+    assert list(vm.get_total_sleep()) == [1, 1]
@@ -87,3 +87,48 @@ if a > 1:
     vm = MIPSVM(program)
     vm.execute()
     assert vm.get_variable('o') == 0
+
+
+def test_deep_nested_expr():
+    program = "out = " + "(" * 60 + "1" + " + 1)" * 60 + "\n"
+    vm = MIPSVM(program)
+    vm.execute()
+    assert vm.get_variable('o') == 61
+
+
+def test_heavier_operand_first():
+    program = """
+p = label(d0, "Sensor")
+out = p.a + (p.b + (p.c + (p.d + p.e * 2)))
+"""
+    vm = MIPSVM(program)
+    vm.execute({('d0', 'a'): 1, ('d0', 'b'): 2, ('d0', 'c'): 3, ('d0', 'd'): 4, ('d0', 'e'): 5})
+    assert vm.get_variable('o') == 20
+    # Left to right would hold a, b, c and d while loading e
+    assert vm.highest_register_used == 1
+
+
+def test_heavier_operand_first_not_commutative():
+    program = """
+p = label(d0, "Sensor")
+out = p.a - (p.b / (p.c - p.d))
+"""
+    vm = MIPSVM(program)
+    vm.execute({('d0', 'a'): 10, ('d0', 'b'): 8, ('d0', 'c'): 6, ('d0', 'd'): 2})
+    assert vm.get_variable('o') == 8
+    assert vm.highest_register_used == 1
+
+
+def test_assignment_reads_target():
+    program = """
+b = 1
+a = 3
+a = (b + 1) + a * 2
+c = 5
+c = max(c * 2, c + 1) - c
+out = a * 10 + c
+"""
+    vm = MIPSVM(program)
+    vm.execute()
+    # a is 8 and c is 5
+    assert vm.get_variable('o') == 85
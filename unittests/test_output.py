@@ -0,0 +1,17 @@
+from compiler.compiler import compile_src
+from compiler.instruction import describe
+
+
+def test_output_plain():
+    output = compile_src("a = 1\nout = a + 2\n")
+    assert output == "move r0 1\nadd o r0 2"
+
+
+def test_output_debug():
+    output = compile_src("a = 1\nout = a + 2\n", debug=True)
+    assert "r0 + 2 -> o" in output
+    assert "a ==> r0" in output
+
+
+def test_describe_branch():
+    assert describe(('bne', 'r0', '1', '5')) == 'Jump to 5 iff r0 != 1'
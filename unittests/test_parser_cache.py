@@ -0,0 +1,10 @@
+from compiler.compiler import get_parser, PARSER_CACHE_FILE, Compiler
+
+
+def test_parser_is_shared():
+    assert get_parser() is get_parser()
+
+
+def test_parser_cache_file():
+    Compiler().compile("out = 1")
+    assert PARSER_CACHE_FILE.exists()
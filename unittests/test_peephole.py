@@ -0,0 +1,92 @@
+from compiler.compiler import Compiler
+from compiler.peephole import Peephole, RULES, peephole_rule
+from unittests.mips_vm import MIPSVM
+
+
+def test_self_move():
+    peephole = Peephole()
+    program, labels = peephole.run([('move', 'r0', '1'), ('move', 'r0', 'r0'), ('j', 'L1')], {'L1': 2})
+    assert program == [('move', 'r0', '1'), ('j', 'L1')]
+    assert labels == {'L1': 1}
+    assert peephole.hits['self_move'] == 1
+
+
+def test_jump_to_next():
+    peephole = Peephole()
+    program, labels = peephole.run([('j', 'L1'), ('move', 'o', '1')], {'L1': 1})
+    assert program == [('move', 'o', '1')]
+    assert labels == {'L1': 0}
+    assert peephole.hits['jump_to_next'] == 1
+
+
+def test_branch_over_jump():
+    peephole = Peephole()
+    program, labels = peephole.run([('beq', 'r0', '0', 'L1'), ('j', 'L2'), ('move', 'o', '1'), ('yield',)],
+                                   {'L1': 2, 'L2': 3})
+    assert program == [('bne', 'r0', '0', 'L2'), ('move', 'o', '1'), ('yield',)]
+    assert labels == {'L1': 1, 'L2': 2}
+    assert peephole.fixups() == [(0, 3, 'L2')]
+
+
+def test_forward_move():
+    registers = {'r0', 'r1'}
+    peephole = Peephole(is_register=registers.__contains__)
+    program, _ = peephole.run([('add', 'r0', 'r1', '1'), ('move', 'o', 'r0')], {})
+    assert program == [('add', 'o', 'r1', '1')]
+
+    # r0 is read after the move
+    peephole = Peephole(is_register=registers.__contains__, live_at_exit=['r0'])
+    program, _ = peephole.run([('add', 'r0', 'r1', '1'), ('move', 'o', 'r0')], {})
+    assert len(program) == 2
+
+
+def test_window_does_not_cross_label():
+    peephole = Peephole()
+    program, _ = peephole.run([('beq', 'r0', '0', 'L1'), ('j', 'L2'), ('move', 'o', '1'), ('bne', 'o', '0', 'L3')],
+                              {'L1': 2, 'L2': 4, 'L3': 1})
+    assert program[0][0] == 'beq'
+
+
+def test_unreachable():
+    peephole = Peephole()
+    program, labels = peephole.run([('j', 'L1'), ('move', 'o', '1'), ('alias', 'Sensor', 'd0'), ('yield',)],
+                                   {'L1': 3, 'L2': 1})
+    assert program == [('j', 'L1'), ('alias', 'Sensor', 'd0'), ('yield',)]
+    assert peephole.hits['unreachable'] == 1
+
+
+def test_select_rules():
+    peephole = Peephole(rules=['self_move'])
+    program, _ = peephole.run([('move', 'r0', 'r0'), ('j', 'L1'), ('yield',)], {'L1': 2})
+    assert program == [('j', 'L1'), ('yield',)]
+
+
+def test_register_rule():
+    @peephole_rule('test_drop_yield')
+    def drop_yield(peephole, i, window):
+        if window[0][0] == 'yield':
+            return []
+
+    try:
+        peephole = Peephole(rules=['test_drop_yield'])
+        program, _ = peephole.run([('yield',), ('move', 'o', '1')], {})
+        assert program == [('move', 'o', '1')]
+        assert peephole.hits == {'test_drop_yield': 1}
+    finally:
+        del RULES['test_drop_yield']
+
+
+def test_while_true():
+    program = """
+while True:
+    out = out + 1
+    yield_tick
+"""
+    compiler = Compiler()
+    compiler.compile(program)
+    assert compiler.peephole_hits['constant_branch'] == 1
+    vm = MIPSVM(program)
+    vm.execute()
+    vm.execute()
+    assert vm.get_variable('o') == 2
+    assert vm.mips_len == 3
@@ -0,0 +1,99 @@
+from compiler.compiler import Compiler
+from unittests.mips_vm import MIPSVM
+
+
+def _loop_program(count):
+    lines = ['while True:']
+    for i in range(count):
+        lines.append(f'    v{i} = out + {i}')
+        lines.append(f'    out = v{i}')
+    lines.append('    yield_tick')
+    return '\n'.join(lines) + '\n'
+
+
+def test_dead_variables_share_registers():
+    # 20 variables, but only one is live at a time inside the loop
+    vm = MIPSVM(_loop_program(20))
+    vm.execute()
+    assert vm.get_variable('o') == sum(range(20))
+    assert vm.highest_register_used == 0
+
+
+def test_live_variables_keep_their_register():
+    program = """
+a = 1
+b = 2
+c = a + b
+out = a * b + c
+"""
+    vm = MIPSVM(program)
+    vm.execute()
+    assert vm.get_variable('o') == 5
+    assert vm.highest_register_used == 2
+
+
+def test_disjoint_variables_share_register():
+    # a is dead once out is computed, b takes over its register
+    program = """
+a = out + 1
+out = a * 2
+b = out + 3
+out = b * 4
+"""
+    vm = MIPSVM(program)
+    vm.execute()
+    assert vm.get_variable('o') == 20
+    assert vm.highest_register_used == 0
+
+
+def test_temporaries_reuse_registers():
+    program = """
+a = (1 + out) * (2 + out) + (3 + out) * (4 + out)
+b = (5 + out) * (6 + out) + (7 + out) * (8 + out)
+out = a * 100 + b
+"""
+    vm = MIPSVM(program)
+    vm.execute()
+    assert vm.get_variable('o') == 1486
+    assert vm.highest_register_used <= 3
+
+
+def test_negative_expression():
+    program = """
+a = 3
+b = -(a + 1)
+out = b
+"""
+    vm = MIPSVM(program)
+    vm.execute()
+    assert vm.get_variable('o') == -4
+
+
+def _live_program(count):
+    lines = [f'v{i} = out + {i}' for i in range(count)]
+    lines.append('out = ' + ' + '.join(f'v{i}' for i in range(count)))
+    return '\n'.join(lines) + '\n'
+
+
+def test_spill_to_stack():
+    vm = MIPSVM(_live_program(20))
+    vm.execute()
+    assert vm.get_variable('o') == sum(range(20))
+    assert vm.highest_register_used <= 15
+
+
+def test_spill_keeps_loop_values_in_registers():
+    program = _live_program(17) + """
+while out < 1000:
+    out = out + v16
+"""
+    compiler = Compiler()
+    mips = compiler.compile(program)
+    assert 'push' in mips
+    # v16 is used in the loop, one of the values outside of it goes to the stack
+    loop = mips.split('\n')[compiler.labels['L1']:]
+    assert 'peek' not in ' '.join(loop)
+    vm = MIPSVM(program)
+    for _ in range(3):
+        vm.execute()
+    assert vm.get_variable('o') == 1000
@@ -0,0 +1,52 @@
+import io
+import json
+import os
+import threading
+import time
+
+import pytest
+
+from compiler.client import request
+from compiler.server import handle_request, serve_stdio, serve_unix
+
+
+def test_server_handle_src():
+    assert handle_request({'src': 'out = 1'}) == {'output': 'move o 1', 'error': None}
+
+
+def test_server_handle_error():
+    response = handle_request({'src': 'out = b'})
+    assert response['error'] == "local variable 'b' referenced before assignment"
+
+
+def test_server_handle_file(tmp_path):
+    script = tmp_path / 'script.py'
+    script.write_text('out = 2\n')
+    assert handle_request({'file': str(script)}) == {'output': 'move o 2', 'error': None}
+    assert (tmp_path / 'script.py.mips').read_text() == 'move o 2'
+
+
+def test_server_stdio():
+    fd_in = io.StringIO('{"src": "out = 1"}\n\n{"src": "out = 2"}\nnot json\n')
+    fd_out = io.StringIO()
+    serve_stdio(fd_in, fd_out)
+    responses = [json.loads(line) for line in fd_out.getvalue().splitlines()]
+    assert [response['output'] for response in responses[:2]] == ['move o 1', 'move o 2']
+    assert responses[2]['error'].startswith('invalid request')
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork') or os.name == 'nt', reason='unix sockets only')
+def test_server_unix(tmp_path):
+    path = str(tmp_path / 'pgc.sock')
+    threading.Thread(target=serve_unix, args=(path,), daemon=True).start()
+    for _ in range(100):
+        if os.path.exists(path):
+            break
+        time.sleep(0.01)
+    assert request(path, {'src': 'out = 3'}) == {'output': 'move o 3', 'error': None}
+
+
+def test_server_handle_rotate_loops():
+    src = 'i = 0\nwhile i < 3:\n    i = i + 1\nout = i\n'
+    response = handle_request({'src': src, 'rotate_loops': True})
+    assert response['output'].split('\n')[3] == 'blt r0 3 2'
@@ -0,0 +1,133 @@
+import json
+
+import pytest
+
+from compiler.compiler import Compiler
+from compiler.exceptions import MipsCodeError
+from compiler.tick_budget import TickBudget
+from unittests.mips_vm import MIPSVM
+
+
+def _report(program):
+    compiler = Compiler()
+    compiler.compile(program)
+    return compiler, compiler.tick_report()
+
+
+def test_polling_loop():
+    program = """
+sensor = label(d0, "Sensor")
+while True:
+    sensor.On = sensor.Pressure > 3
+    yield_tick
+"""
+    _, report = _report(program)
+    assert report['ok']
+    assert [(s['start'], s['end'], s['instructions']) for s in report['segments']] == [(0, 4, 5), (5, 4, 5)]
+    assert json.loads(json.dumps(report)) == report
+
+
+def test_longest_branch():
+    program = """
+sensor = label(d0, "Sensor")
+while True:
+    if sensor.Pressure > 3:
+        out = sensor.Pressure * 2 + sensor.Temperature
+    else:
+        out = 1
+    sleep(1)
+"""
+    compiler, report = _report(program)
+    first = report['segments'][0]
+    # The longer then branch counts, sleep ends the tick and costs a line
+    assert first['status'] == 'ok'
+    assert first['end'] == len(compiler.program) - 2
+    assert first['instructions'] == len(first['path'])
+
+
+@pytest.mark.parametrize('compiled', [False, True])
+@pytest.mark.parametrize('end', ['yield_tick', 'sleep(1)'])
+def test_report_matches_vm(compiled, end):
+    program = f"""
+sensor = label(d0, "Sensor")
+while True:
+    if sensor.Pressure > 3:
+        out = sensor.Pressure * 2 + sensor.Temperature
+    else:
+        out = 1
+    {end}
+"""
+    _, report = _report(program)
+    vm = MIPSVM(program, compiled=compiled)
+    # The high pressure takes the longest path, the VM counts the yield or sleep like the report
+    for segment in report['segments']:
+        vm.execute({('d0', 'Pressure'): 5, ('d0', 'Temperature'): 1})
+        assert vm.tick_inst == segment['instructions']
+
+
+def test_yield_and_sleep_cost_the_same():
+    template = """
+sensor = label(d0, "Sensor")
+while True:
+    out = sensor.Pressure + 1
+    {}
+"""
+    _, yielded = _report(template.format('yield_tick'))
+    _, slept = _report(template.format('sleep(1)'))
+    counts = [[s['instructions'] for s in report['segments']] for report in (yielded, slept)]
+    assert counts[0] == counts[1] == [4, 4]
+
+
+def test_bounded_loop_without_yield():
+    program = """
+i = 0
+while i < 3:
+    i = i + 1
+out = i
+"""
+    _, report = _report(program)
+    # The trip count is unknown, the loop is bounded by the budget but not an error
+    assert report['ok']
+    segment, = report['segments']
+    assert segment['status'] == 'unbounded'
+    assert segment['instructions'] == report['budget']
+    # The path ends where the loop repeats
+    assert segment['path'][-1] in segment['path'][:-1]
+    vm = MIPSVM(program)
+    vm.execute()
+    assert vm.get_variable('o') == 3
+    assert vm.tick_inst < report['budget']
+
+
+def test_endless_loop_without_yield():
+    program = """
+while True:
+    out = out + 1
+"""
+    _, report = _report(program)
+    segment, = report['segments']
+    assert segment['status'] == 'unbounded'
+    # The game stops the loop at the budget, as the report bounds it
+    vm = MIPSVM(program)
+    vm.execute()
+    assert vm.tick_inst == segment['instructions']
+
+
+def test_overflow():
+    compiler = Compiler()
+    compiler.compile("""
+a = 1
+b = a + 1
+out = a + b
+yield_tick
+out = 2
+""")
+    segments = TickBudget(compiler.program, compiler.labels, compiler.fixups, budget=2).segments()
+    assert [s['status'] for s in segments] == ['overflow', 'ok']
+
+
+def test_program_too_large():
+    # Reported like any other compile error instead of a bare Exception
+    program = 'a = 1\n' + ''.join(f'out = a + {k}\n' for k in range(130))
+    with pytest.raises(MipsCodeError):
+        Compiler().compile(program)
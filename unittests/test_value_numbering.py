@@ -0,0 +1,98 @@
+from compiler.compiler import Compiler
+from unittests.mips_vm import MIPSVM
+
+
+def _loads(program):
+    compiler = Compiler()
+    mips = compiler.compile(program)
+    return [line for line in mips.split('\n') if line.startswith('l ')], compiler.reused_values
+
+
+def test_reuse_load():
+    program = """
+sensor = label(d0, "Sensor")
+a = sensor.Pressure * 2
+b = sensor.Pressure + 1
+out = a + b + sensor.Pressure
+"""
+    loads, reused = _loads(program)
+    assert len(loads) == 1
+    assert reused['load'] == 2
+
+    vm = MIPSVM(program)
+    vm.execute({('d0', 'Pressure'): 10})
+    assert vm.get_variable('o') == 41
+
+
+def test_store_to_device_kills_load():
+    program = """
+sensor = label(d0, "Sensor")
+pump = label(d1, "Pump")
+a = sensor.Setting
+pump.On = 1
+b = sensor.Setting
+sensor.Setting = 5
+out = sensor.Setting + a + b
+"""
+    loads, _ = _loads(program)
+    assert len(loads) == 2
+
+    vm = MIPSVM(program)
+    vm.execute({('d0', 'Setting'): 1, ('d1', 'On'): 0})
+    assert vm.get_variable('o') == 7
+
+
+def test_yield_kills_load():
+    program = """
+sensor = label(d0, "Sensor")
+a = sensor.Pressure
+yield_tick
+out = sensor.Pressure - a
+"""
+    loads, _ = _loads(program)
+    assert len(loads) == 2
+
+    vm = MIPSVM(program)
+    vm.execute({('d0', 'Pressure'): 1})
+    vm.execute({('d0', 'Pressure'): 3})
+    assert vm.get_variable('o') == 2
+
+
+def test_loop_head_kills_load():
+    program = """
+sensor = label(d0, "Sensor")
+a = sensor.Pressure
+while out < 3:
+    out = out + sensor.Pressure - a + 1
+"""
+    loads, _ = _loads(program)
+    assert len(loads) == 2
+
+
+def test_reuse_expression():
+    program = """
+a = out + 1
+b = (out + 1) * 2
+c = 1 + out
+out = a * 100 + b * 10 + c
+"""
+    compiler = Compiler()
+    compiler.compile(program)
+    assert compiler.reused_values['expression'] == 2
+
+    vm = MIPSVM(program)
+    vm.execute()
+    assert vm.get_variable('o') == 121
+
+
+def test_redefined_operand():
+    program = """
+a = 1
+b = a + 1
+a = 5
+c = a + 1
+out = b * 10 + c
+"""
+    vm = MIPSVM(program)
+    vm.execute()
+    assert vm.get_variable('o') == 26
@@ -0,0 +1,30 @@
+import os
+
+from compiler.watch import Watcher
+
+
+def test_watch_recompiles_changed(tmp_path):
+    script_1 = tmp_path / 's1.py'
+    script_2 = tmp_path / 's2.py'
+    script_1.write_text('out = 1\n')
+    script_2.write_text('out = 2\n')
+
+    watcher = Watcher(tmp_path)
+    assert [result.file for result, _ in watcher.poll()] == [script_1, script_2]
+    assert watcher.poll() == []
+
+    script_2.write_text('out = 3\n')
+    os.utime(script_2, ns=(0, 0))
+    results = watcher.poll()
+    assert [result.file for result, _ in results] == [script_2]
+    assert (tmp_path / 's2.py.mips').read_text() == 'move o 3'
+
+
+def test_watch_ignores_touch(tmp_path):
+    script = tmp_path / 's1.py'
+    script.write_text('out = 1\n')
+    watcher = Watcher(tmp_path)
+    watcher.poll()
+
+    os.utime(script, ns=(0, 0))
+    assert watcher.poll() == []
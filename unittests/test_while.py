@@ -1,3 +1,4 @@
+from compiler.compiler import Compiler
 from unittests.mips_vm import MIPSVM
 
 
@@ -39,3 +40,59 @@ yield_tick
     vm.execute()
     vm.execute()
     assert vm.get_variable('o') == 10
+
+
+def test_while_compare_branch():
+    program = """
+while out < 10:
+    out = out + 1
+"""
+    vm = MIPSVM(program)
+    vm.execute()
+    assert vm.get_variable('o') == 10
+    assert vm.mips_len == 3
+
+
+def _rotated(program):
+    mips = Compiler(rotate_loops=True).compile(program)
+    vm = MIPSVM()
+    vm.parse(mips)
+    return vm, mips.split('\n')
+
+
+def test_rotated_while():
+    program = """
+i = 0
+while i < 10:
+    i = i + 1
+out = i
+"""
+    vm, mips = _rotated(program)
+    assert mips == ['move r0 0', 'bge r0 10 4', 'add r0 r0 1', 'blt r0 10 2', 'move o r0']
+    vm.execute()
+    assert vm.get_variable('o') == 10
+
+
+def test_rotated_while_not_entered():
+    program = """
+i = 20
+while i < 10 and i > 5:
+    i = i + 1
+out = i
+"""
+    vm, _ = _rotated(program)
+    vm.execute()
+    assert vm.get_variable('o') == 20
+
+
+def test_rotated_while_true():
+    program = """
+while True:
+    out = out + 1
+    yield_tick
+"""
+    vm, mips = _rotated(program)
+    assert mips == ['add o o 1', 'yield', 'j 0']
+    vm.execute()
+    vm.execute()
+    assert vm.get_variable('o') == 2